@@ -3,9 +3,14 @@
 
 import sublime
 import sublime_plugin
+import collections
+import hashlib
 import re
 import os
+import time
+import types
 from datetime import datetime
+from urllib.parse import urlparse
 
 try:
     from . import ai_client
@@ -18,72 +23,91 @@ except ImportError:
         AI_CLIENT_AVAILABLE = False
         print("AutoSaveWithAI: ai_client module not found")
 
+# Naming works without the cache; every save then asks the LLM
+try:
+    from . import filename_cache
+    FILENAME_CACHE_AVAILABLE = True
+except ImportError:
+    try:
+        import filename_cache
+        FILENAME_CACHE_AVAILABLE = True
+    except ImportError:
+        FILENAME_CACHE_AVAILABLE = False
+        print("AutoSaveWithAI: filename_cache module not found, filenames won't be cached")
+
+try:
+    from . import excerpts
+except ImportError:
+    import excerpts
+
 
 class AIClient:
     """Handles communication with OpenAI-compatible API providers"""
 
     def __init__(self, model, api_key=None, api_base=None, api_type="chat",
-                 auth_header_name="Authorization", auth_header_prefix="Bearer "):
+                 auth_header_name="Authorization", auth_header_prefix="Bearer ", stream=False,
+                 retry_policy=None, hedge=False, hedge_api_bases=None, endpoints=None,
+                 connect_timeout=10, read_timeout=30, background=False, prompt_cache="auto"):
         self.model = model
         self.api_key = api_key
         self.api_base = api_base
         self.api_type = api_type
         self.auth_header_name = auth_header_name
         self.auth_header_prefix = auth_header_prefix
-
-    def generate_filename(self, content, prompt_template):
+        self.stream = stream
+        self.retry_policy = retry_policy
+        self.hedge = hedge
+        self.hedge_api_bases = hedge_api_bases or []
+        # Optional list of ai_client.Endpoint to load-balance across instead of api_base
+        self.endpoints = endpoints or []
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        # Background (timer) saves yield to interactive ones in the rate limiter
+        self.background = background
+        # Prompt-cache hint style: "auto", "prompt_cache_key", "cache_control" or "none"
+        self.prompt_cache = prompt_cache
+
+    def generate_filename(self, content, prompt_template, time_budget=None):
         """
         Call LLM API to generate a filename based on content
         Returns None if API call fails
+
+        time_budget caps the whole call in seconds (connects, retries, hedges and
+        failover included); None leaves only the per-operation timeouts.
         """
         if not AI_CLIENT_AVAILABLE:
             print("AutoSaveWithAI: ai_client module not available")
             return None
 
-        if not self.api_key:
+        endpoints = [e for e in self.endpoints if e.api_key and e.api_base]
+        if self.endpoints and not endpoints:
+            print("AutoSaveWithAI: No endpoint has both an API key and a base URL")
+            return None
+
+        if not self.endpoints and not self.api_key:
             print("AutoSaveWithAI: No API key provided")
             return None
 
-        if not self.api_base:
+        if not self.endpoints and not self.api_base:
             print("AutoSaveWithAI: No API base URL provided")
             return None
 
         try:
-            prompt = prompt_template.replace('{content}', content)
+            deadline = ai_client.Deadline(time_budget) if time_budget else None
+            prompt = split_prompt(prompt_template, content)
             print("AutoSaveWithAI: Sending {} characters to LLM".format(len(content)))
-            print("AutoSaveWithAI: Using API type: {}".format(self.api_type))
-            print("AutoSaveWithAI: Using API base: {}".format(self.api_base))
-
-            if self.api_type == "responses":
-                # Use Responses API with chat-like message format
-                input_value = [
-                    {"type": "message", "role": "user", "content": prompt}
-                ]
-                print("AutoSaveWithAI: Making Responses API call...")
-                response = ai_client.responses_create(
-                    base_url=self.api_base,
-                    api_key=self.api_key,
-                    model=self.model,
-                    input_value=input_value,
-                    max_output_tokens=100,
-                    auth_header_name=self.auth_header_name,
-                    auth_header_prefix=self.auth_header_prefix
-                )
-                result = ai_client.extract_response_text(response).strip()
+
+            # Identical prompts already in flight (same buffer in several views, or a
+            # timer save overlapping a manual one) share that request's answer
+            if endpoints:
+                targets = tuple((e.api_base, e.model) for e in endpoints)
             else:
-                # Use Chat Completions API (default)
-                messages = [{"role": "user", "content": prompt}]
-                print("AutoSaveWithAI: Making Chat Completions API call...")
-                response = ai_client.chat_completion(
-                    base_url=self.api_base,
-                    api_key=self.api_key,
-                    model=self.model,
-                    messages=messages,
-                    max_tokens=100,
-                    auth_header_name=self.auth_header_name,
-                    auth_header_prefix=self.auth_header_prefix
-                )
-                result = ai_client.extract_chat_content(response).strip()
+                targets = ((self.api_base, self.model),)
+            result = ai_client.single_flight.do(
+                (targets, prompt),
+                lambda: self._generate(prompt, endpoints, deadline),
+                timeout=deadline.remaining() if deadline is not None else None
+            )
 
             print("AutoSaveWithAI: LLM responded with: {}".format(result))
             return result
@@ -93,11 +117,307 @@ class AIClient:
             print("AutoSaveWithAI: LLM API error: {}".format(e))
             return None
 
+    def _generate(self, prompt, endpoints, deadline=None):
+        """Request a filename via load balancing, hedging or a single request, as configured"""
+        if endpoints:
+            print("AutoSaveWithAI: Balancing across {} endpoints".format(len(endpoints)))
+            return self._generate_balanced(prompt, ai_client.get_load_balancer(endpoints), deadline)
+
+        print("AutoSaveWithAI: Using API type: {}".format(self.api_type))
+        print("AutoSaveWithAI: Using API base: {}".format(self.api_base))
+        if self.hedge:
+            # Primary request first, then a hedge to the alternate (or same) endpoint
+            # if the primary is slower than usual
+            targets = [self.api_base] + (self.hedge_api_bases or [self.api_base])
+            attempts = [
+                lambda token, endpoint=self._endpoint(api_base): self._request_filename(
+                    prompt, endpoint, token, deadline
+                )
+                for api_base in targets
+            ]
+            return ai_client.run_hedged(attempts, is_valid=bool)
+
+        return self._request_filename(prompt, self._endpoint(self.api_base), deadline=deadline)
+
+    def _endpoint(self, api_base):
+        """This client's model, key and auth settings aimed at api_base"""
+        return ai_client.Endpoint(
+            api_base=api_base,
+            model=self.model,
+            api_key=self.api_key,
+            api_type=self.api_type,
+            auth_header_name=self.auth_header_name,
+            auth_header_prefix=self.auth_header_prefix
+        )
+
+    def _priority(self):
+        return ai_client.PRIORITY_BACKGROUND if self.background else ai_client.PRIORITY_INTERACTIVE
+
+    def _generate_balanced(self, prompt, balancer, deadline=None):
+        """
+        Send to the best endpoint the balancer offers, failing over to the next best
+        when a request fails. With hedging, the hedge goes to the runner-up endpoint,
+        which stays available for failover if the hedge was never sent.
+        """
+        tried = []
+        last_error = None
+        while True:
+            endpoint = balancer.select(exclude=tried)
+            if endpoint is None:
+                break
+            tried.append(endpoint)
+            print("AutoSaveWithAI: Using endpoint {} ({})".format(endpoint.api_base, endpoint.model))
+
+            targets = [endpoint]
+            runner_up = None
+            if self.hedge:
+                runner_up = balancer.select(exclude=tried)
+                targets.append(runner_up or endpoint)
+            attempts = [
+                lambda token, target=target: balancer.call(
+                    target, lambda: self._request_filename(prompt, target, token, deadline)
+                )
+                for target in targets
+            ]
+            launched = []
+            try:
+                if self.hedge:
+                    return ai_client.run_hedged(attempts, is_valid=bool, launched=launched)
+                return attempts[0](None)
+            except ai_client.DeadlineExceededError:
+                # No time left to try another endpoint
+                raise
+            except Exception as e:
+                print("AutoSaveWithAI: Endpoint {} failed: {}".format(endpoint.api_base, e))
+                last_error = e
+            # The runner-up is only done with if the hedge was sent to it
+            if runner_up is not None and 1 in launched:
+                tried.append(runner_up)
+
+        raise last_error or ai_client.OpenAIHTTPError("No endpoints available")
+
+    def _request_filename(self, prompt, endpoint, cancel_token=None, deadline=None):
+        """Send one filename request to endpoint and return the stripped answer"""
+        if self.stream:
+            return self._generate_streaming(prompt, endpoint, cancel_token, deadline)
+
+        if endpoint.api_type == "responses":
+            # Use Responses API with chat-like message format
+            print("AutoSaveWithAI: Making Responses API call...")
+            response = ai_client.responses_create(
+                base_url=endpoint.api_base,
+                api_key=endpoint.api_key,
+                model=endpoint.model,
+                input_value=self._messages(prompt, endpoint),
+                max_output_tokens=100,
+                auth_header_name=endpoint.auth_header_name,
+                auth_header_prefix=endpoint.auth_header_prefix,
+                retry_policy=self.retry_policy,
+                cancel_token=cancel_token,
+                connect_timeout=self.connect_timeout,
+                read_timeout=self.read_timeout,
+                deadline=deadline,
+                priority=self._priority(),
+                prompt_cache_key=self._prompt_cache_key(prompt, endpoint)
+            )
+            self._log_usage(response)
+            return ai_client.extract_response_text(response).strip()
+
+        # Use Chat Completions API (default)
+        print("AutoSaveWithAI: Making Chat Completions API call...")
+        response = ai_client.chat_completion(
+            base_url=endpoint.api_base,
+            api_key=endpoint.api_key,
+            model=endpoint.model,
+            messages=self._messages(prompt, endpoint),
+            max_tokens=100,
+            auth_header_name=endpoint.auth_header_name,
+            auth_header_prefix=endpoint.auth_header_prefix,
+            retry_policy=self.retry_policy,
+            cancel_token=cancel_token,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+            deadline=deadline,
+            priority=self._priority(),
+            prompt_cache_key=self._prompt_cache_key(prompt, endpoint)
+        )
+        self._log_usage(response)
+        return ai_client.extract_chat_content(response).strip()
+
+    def _cache_hint_style(self, endpoint):
+        """How to mark the static prompt prefix as cacheable for endpoint, or None"""
+        if self.prompt_cache != "auto":
+            return None if self.prompt_cache == "none" else self.prompt_cache
+        model = (endpoint.model or "").lower()
+        if model.startswith(("anthropic/", "claude")):
+            # Anthropic models (directly or via gateways) only cache marked blocks
+            return "cache_control"
+        host = (urlparse(endpoint.api_base).hostname or "").lower()
+        if host == "api.openai.com" or host.endswith(".openai.azure.com"):
+            return "prompt_cache_key"
+        return None
+
+    def _messages(self, prompt, endpoint):
+        """
+        Static instructions first (a system message, or developer for the Responses API),
+        then the text to name, so every request shares a byte-identical cacheable prefix
+        """
+        instructions, text = prompt
+        messages = []
+        if instructions:
+            content = instructions
+            if self._cache_hint_style(endpoint) == "cache_control":
+                # Responses API input uses its own content part type
+                block_type = "input_text" if endpoint.api_type == "responses" else "text"
+                content = [{"type": block_type, "text": instructions, "cache_control": {"type": "ephemeral"}}]
+            role = "developer" if endpoint.api_type == "responses" else "system"
+            messages.append({"role": role, "content": content})
+        messages.append({"role": "user", "content": text})
+        if endpoint.api_type == "responses":
+            for message in messages:
+                message["type"] = "message"
+        return messages
+
+    def _prompt_cache_key(self, prompt, endpoint):
+        """Stable key per model and instructions, so the provider routes them to one cache"""
+        if not prompt[0] or self._cache_hint_style(endpoint) != "prompt_cache_key":
+            return None
+        digest = hashlib.sha1("{}\0{}".format(endpoint.model, prompt[0]).encode("utf-8")).hexdigest()
+        return "autosave-{}".format(digest[:16])
+
+    def _log_usage(self, response):
+        usage = ai_client.extract_usage(response)
+        if usage is not None:
+            print("AutoSaveWithAI: Tokens: {} in ({} cached), {} out".format(
+                usage["input_tokens"], usage["cached_tokens"], usage["output_tokens"]
+            ))
+
+    def _generate_streaming(self, prompt, endpoint, cancel_token=None, deadline=None):
+        """
+        Stream the completion and stop reading as soon as a complete filename has arrived,
+        so chatty models that keep explaining themselves don't add to the save latency
+        """
+        start = time.monotonic()
+        if endpoint.api_type == "responses":
+            print("AutoSaveWithAI: Making streaming Responses API call...")
+            deltas = ai_client.responses_create_stream(
+                base_url=endpoint.api_base,
+                api_key=endpoint.api_key,
+                model=endpoint.model,
+                input_value=self._messages(prompt, endpoint),
+                max_output_tokens=100,
+                auth_header_name=endpoint.auth_header_name,
+                auth_header_prefix=endpoint.auth_header_prefix,
+                retry_policy=self.retry_policy,
+                cancel_token=cancel_token,
+                connect_timeout=self.connect_timeout,
+                read_timeout=self.read_timeout,
+                deadline=deadline,
+                priority=self._priority(),
+                prompt_cache_key=self._prompt_cache_key(prompt, endpoint)
+            )
+        else:
+            print("AutoSaveWithAI: Making streaming Chat Completions API call...")
+            deltas = ai_client.chat_completion_stream(
+                base_url=endpoint.api_base,
+                api_key=endpoint.api_key,
+                model=endpoint.model,
+                messages=self._messages(prompt, endpoint),
+                max_tokens=100,
+                auth_header_name=endpoint.auth_header_name,
+                auth_header_prefix=endpoint.auth_header_prefix,
+                retry_policy=self.retry_policy,
+                cancel_token=cancel_token,
+                connect_timeout=self.connect_timeout,
+                read_timeout=self.read_timeout,
+                deadline=deadline,
+                priority=self._priority(),
+                prompt_cache_key=self._prompt_cache_key(prompt, endpoint)
+            )
+
+        text = ""
+        try:
+            for delta in deltas:
+                if not text:
+                    # Time to first token is where a prompt-cache hit shows
+                    ai_client.metrics.observe("stream.first_token_seconds", time.monotonic() - start)
+                text += delta
+                filename = complete_filename(text)
+                if filename:
+                    print("AutoSaveWithAI: Filename complete, closing stream early")
+                    return filename
+        finally:
+            deltas.close()
+        return text.strip()
+
+
+# Extensions that mark the end of a streamed filename even before a newline arrives
+FILENAME_EXTENSIONS = (
+    "txt", "md", "markdown", "json", "py", "js", "ts", "html", "css", "csv", "yaml", "yml",
+    "xml", "sql", "sh", "log", "ini", "toml", "rst", "java", "c", "cpp", "h", "go", "rs", "rb",
+)
+
+_STREAMED_FILENAME_RE = re.compile(
+    r'^\s*[`"\']?([^\s`"\']+\.(?:' + '|'.join(FILENAME_EXTENSIONS) + r'))[`"\'\s,;]',
+    re.IGNORECASE
+)
+
+
+def complete_filename(partial_text: str):
+    """
+    Return the filename from a partially streamed LLM answer once it is complete, else None.
+    Complete means either a finished first line (code fences are skipped) or a name with a
+    recognized extension followed by a delimiter.
+    """
+    match = _STREAMED_FILENAME_RE.match(partial_text)
+    if match:
+        return match.group(1)
+
+    lines = partial_text.split('\n')
+    for line in lines[:-1]:  # the last element is still being streamed
+        line = line.strip()
+        # Fences may carry a language tag ("```markdown")
+        if line and not line.startswith('```') and line.strip('`'):
+            return line
+    return None
+
 
 def extract_first_words(text: str, word_limit: int = 250) -> str:
-    """Extract first N words from text using naive space splitting"""
-    words = text.split()
-    return ' '.join(words[:word_limit])
+    """Extract first N words from text, scanning only as far as the limit"""
+    return excerpts.first_words([text], word_limit)
+
+
+def view_reader(view: sublime.View):
+    """Callable (begin, end) -> text of that range of the view"""
+    return lambda begin, end: view.substr(sublime.Region(begin, end))
+
+
+def view_chunks(view: sublime.View, chunk_chars: int = excerpts.CHUNK_CHARS):
+    """Yield the view's text in bounded chunks instead of copying the whole buffer at once"""
+    return excerpts.iter_chunks(view_reader(view), view.size(), chunk_chars)
+
+
+def take_excerpt(view: sublime.View, sampling: str, token_budget: int, rules=(), report=None) -> str:
+    """Excerpt of the view within token_budget, by the excerpt_sampling mode"""
+    if sampling == "head":
+        return excerpts.first_tokens(view_chunks(view), token_budget, rules, report)
+    return excerpts.sample_tokens(view_reader(view), view.size(), token_budget, rules, report)
+
+
+def split_prompt(prompt_template: str, content: str):
+    """
+    Split a prompt into (instructions, text to name) so the instructions can be sent as
+    their own message, identical across requests. The template's wording around
+    {content} becomes the instructions. Templates without exactly one {content} are
+    sent whole as the text, with empty instructions.
+    """
+    if prompt_template.count('{content}') != 1:
+        return "", prompt_template.replace('{content}', content)
+    before, after = prompt_template.split('{content}')
+    instructions = before.strip()
+    if after.strip():
+        instructions = "{}\n\n{}".format(instructions, after.strip()).strip()
+    return instructions, content
 
 
 def sanitize_filename(filename: str) -> str:
@@ -130,16 +450,393 @@ def get_settings():
     return sublime.load_settings("AutoSaveWithAI.sublime-settings")
 
 
+# Every setting the plugin reads, with the default used when it is unset or invalid
+SETTINGS_DEFAULTS = collections.OrderedDict([
+    ("save_directory", ""),
+    ("overwrite_default_save", False),
+    ("auto_save_timer", 0),
+    ("llm_model", "gpt-3.5-turbo"),
+    ("excerpt_token_budget", 400),
+    ("excerpt_token_budgets", {}),
+    ("excerpt_sampling", "head_middle_tail"),
+    ("excerpt_compaction", ["drop_license_headers", "dedupe_log_prefixes", "collapse_whitespace"]),
+    ("excerpt_syntax_hint", True),
+    ("prompt_template",
+     "Based on the following text, suggest a short, descriptive filename. "
+     "Include an appropriate file extension (.txt, .md, .json, .py, etc.) based on the content type. "
+     "Respond with ONLY the filename, nothing else.\n\nText: {content}"),
+    ("openai_api_key", None),
+    ("anthropic_api_key", None),
+    ("api_key", None),
+    ("api_base", "https://api.openai.com/v1"),
+    ("api_type", "chat"),
+    ("auth_header_name", "Authorization"),
+    ("auth_header_prefix", "Bearer "),
+    ("endpoints", None),
+    ("stream_response", False),
+    ("prompt_cache", "auto"),
+    ("retry_max_attempts", 3),
+    ("connect_timeout", 10),
+    ("read_timeout", 30),
+    ("interactive_save_deadline", 8),
+    ("timer_save_deadline", 60),
+    ("hedge_requests", False),
+    ("hedge_api_base", ""),
+    ("hedge_percentile", 0.95),
+    ("hedge_budget_ratio", 0.1),
+    ("circuit_breaker_failure_threshold", 5),
+    ("circuit_breaker_cooldown", 30),
+    ("rate_limit_rpm", 0),
+    ("rate_limit_tpm", 0),
+    ("ssl_ca_bundle", ""),
+    ("ssl_minimum_version", ""),
+    ("ssl_alpn_protocols", ["http/1.1"]),
+    ("request_compression", False),
+    ("request_compression_min_bytes", 1024),
+    ("dns_cache_ttl", 60),
+    ("max_response_bytes", 4194304),
+    ("json_backend", "auto"),
+    ("http_proxy", ""),
+    ("https_proxy", ""),
+    ("no_proxy", ""),
+    ("prewarm_connections", True),
+    ("filename_cache_size", 256),
+    ("filename_cache_ttl", 86400),
+    ("persistent_filename_cache", True),
+    ("persistent_filename_cache_size", 10000),
+    ("persistent_filename_cache_ttl", 2592000),
+    ("similar_filename_cache", True),
+    ("similar_filename_max_distance", 6),
+])
+
+# Accepted types of the settings whose default is None (unset)
+_OPTIONAL_SETTING_TYPES = {
+    "openai_api_key": (str,),
+    "anthropic_api_key": (str,),
+    "api_key": (str,),
+    "endpoints": (list,),
+}
+
+# Settings in seconds whose defaults are whole numbers but which take fractions too;
+# other settings with int defaults (counts, sizes, distances) only take ints
+_FRACTIONAL_SETTINGS = frozenset([
+    "auto_save_timer",
+    "connect_timeout",
+    "read_timeout",
+    "interactive_save_deadline",
+    "timer_save_deadline",
+    "circuit_breaker_cooldown",
+    "dns_cache_ttl",
+    "filename_cache_ttl",
+    "persistent_filename_cache_ttl",
+])
+
+# Settings that take one of a fixed set of values
+_SETTING_CHOICES = {
+    "api_type": ("chat", "responses"),
+    "prompt_cache": ("auto", "prompt_cache_key", "cache_control", "none"),
+    "excerpt_sampling": ("head", "head_middle_tail"),
+}
+
+
+class SettingsSnapshot(collections.namedtuple("SettingsSnapshot", list(SETTINGS_DEFAULTS))):
+    """Immutable, validated copy of the plugin settings, read through plain attributes"""
+    __slots__ = ()
+
+
+def _setting_types(name, default):
+    """Types a value of setting name may have, judged from its default"""
+    if default is None:
+        return _OPTIONAL_SETTING_TYPES[name]
+    if isinstance(default, bool):
+        return (bool,)
+    if isinstance(default, float) or isinstance(default, int) and name in _FRACTIONAL_SETTINGS:
+        return (int, float)
+    return (type(default),)
+
+
+def build_settings_snapshot(settings):
+    """
+    Read and validate every setting once
+
+    Args:
+        settings: Plugin settings object (anything with get(name, default))
+
+    Returns:
+        SettingsSnapshot; values of the wrong type are reported and replaced by
+        their defaults, lists become tuples and dicts read-only mappings
+    """
+    values = []
+    for name, default in SETTINGS_DEFAULTS.items():
+        value = settings.get(name, default)
+        if value is not None:
+            accepted = _setting_types(name, default)
+            # bool is an int subclass, so true/false must not pass for a number
+            if (not isinstance(value, accepted) or (isinstance(value, bool) and bool not in accepted)
+                    or value not in _SETTING_CHOICES.get(name, (value,))):
+                print("AutoSaveWithAI: Invalid value for {}: {!r}, using {!r}".format(name, value, default))
+                value = default
+        elif default is not None:
+            value = default
+        if isinstance(value, list):
+            value = tuple(dict(item) if isinstance(item, dict) else item for item in value)
+        elif isinstance(value, dict):
+            value = types.MappingProxyType(dict(value))
+        values.append(value)
+    return SettingsSnapshot(*values)
+
+
+SETTINGS_LISTENER_KEY = "AutoSaveWithAI"
+
+# Built on first use and replaced only when the settings file changes
+_snapshot = None
+
+
+def get_snapshot():
+    """Current settings snapshot; cheap enough for per-keystroke callers"""
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is None:
+        settings = get_settings()
+        settings.clear_on_change(SETTINGS_LISTENER_KEY)
+        settings.add_on_change(SETTINGS_LISTENER_KEY, reload_snapshot)
+        snapshot = _snapshot = build_settings_snapshot(settings)
+    return snapshot
+
+
+def reload_snapshot():
+    """Rebuild the snapshot; registered with settings.add_on_change"""
+    global _snapshot
+    _snapshot = build_settings_snapshot(get_settings())
+    print("AutoSaveWithAI: Settings reloaded")
+
+
+def select_api_key(settings, model):
+    """
+    Pick the API key setting that matches the provider of model
+
+    Args:
+        settings: SettingsSnapshot
+        model: Model name, optionally with a provider prefix (e.g. "anthropic/...")
+
+    Returns:
+        The API key string, or None if the matching setting is unset
+    """
+    if model.startswith("gpt-") or model.startswith("openai/"):
+        print("AutoSaveWithAI: Using OpenAI provider")
+        return settings.openai_api_key
+    elif model.startswith("anthropic/"):
+        print("AutoSaveWithAI: Using Anthropic provider")
+        return settings.anthropic_api_key
+    else:
+        # For other providers, check if there's a generic api_key setting
+        print("AutoSaveWithAI: Using provider from model string: {}".format(model))
+        return settings.api_key
+
+
+def get_endpoints(settings, model, api_base, api_type, auth_header_name, auth_header_prefix):
+    """
+    Build the load-balanced endpoint list from the "endpoints" setting
+
+    Each entry is a dict with "api_base" and optionally "llm_model", "api_key",
+    "api_type", "auth_header_name" and "auth_header_prefix"; missing keys fall back
+    to the top-level settings passed in.
+
+    Returns:
+        List of ai_client.Endpoint, empty when load balancing is not configured
+    """
+    endpoints = []
+    for entry in settings.endpoints or ():
+        if not isinstance(entry, dict) or not entry.get("api_base"):
+            print("AutoSaveWithAI: Ignoring endpoint without api_base: {}".format(entry))
+            continue
+        endpoint_model = entry.get("llm_model", model)
+        endpoints.append(ai_client.Endpoint(
+            api_base=entry["api_base"],
+            model=endpoint_model,
+            api_key=entry.get("api_key") or select_api_key(settings, endpoint_model),
+            api_type=entry.get("api_type", api_type),
+            auth_header_name=entry.get("auth_header_name", auth_header_name),
+            auth_header_prefix=entry.get("auth_header_prefix", auth_header_prefix)
+        ))
+    return endpoints
+
+
+def configure_transport(settings):
+    """
+    Apply process-wide HTTP settings (TLS, compression, circuit breakers, hedging, rate limits,
+    DNS, proxies, response limits, JSON backend) to ai_client.
+    ai_client ignores calls whose options have not changed, so this is cheap per save.
+    """
+    if not AI_CLIENT_AVAILABLE:
+        return
+
+    ca_bundle = settings.ssl_ca_bundle
+    try:
+        ai_client.configure_ssl(
+            cafile=os.path.expanduser(ca_bundle) if ca_bundle else None,
+            minimum_version=settings.ssl_minimum_version,
+            alpn_protocols=settings.ssl_alpn_protocols
+        )
+    except Exception as e:
+        print("AutoSaveWithAI: Invalid TLS settings, using defaults: {}".format(e))
+        ai_client.configure_ssl()
+
+    ai_client.configure_compression(
+        enabled=settings.request_compression,
+        min_bytes=settings.request_compression_min_bytes
+    )
+    ai_client.configure_circuit_breakers(
+        failure_threshold=settings.circuit_breaker_failure_threshold,
+        cooldown=settings.circuit_breaker_cooldown
+    )
+    ai_client.configure_hedging(
+        percentile=settings.hedge_percentile,
+        budget_ratio=settings.hedge_budget_ratio
+    )
+    ai_client.configure_dns_cache(ttl=settings.dns_cache_ttl)
+    rpm = settings.rate_limit_rpm
+    tpm = settings.rate_limit_tpm
+    for api_base in (settings.api_base, settings.hedge_api_base):
+        if api_base:
+            ai_client.configure_rate_limit(api_base, rpm=rpm, tpm=tpm)
+    for entry in settings.endpoints or ():
+        if isinstance(entry, dict) and entry.get("api_base"):
+            ai_client.configure_rate_limit(entry["api_base"], rpm=entry.get("rpm", rpm), tpm=entry.get("tpm", tpm))
+    ai_client.configure_response_limit(settings.max_response_bytes)
+    json_backend = settings.json_backend
+    if json_backend != ai_client.json_backend:
+        try:
+            ai_client.configure_json_backend(json_backend)
+        except (ImportError, ValueError) as e:
+            print("AutoSaveWithAI: JSON backend {} unavailable, using auto: {}".format(json_backend, e))
+            ai_client.configure_json_backend("auto")
+    ai_client.configure_proxy(
+        http_proxy=settings.http_proxy,
+        https_proxy=settings.https_proxy,
+        no_proxy=settings.no_proxy
+    )
+
+
+# The settings snapshot whose persistent filename cache could not be opened; saves under
+# it don't retry the open (and log the failure again) until the settings change
+_disk_cache_failed_for = None
+
+
+def configure_cache(settings):
+    """Apply filename cache settings; cheap enough to run on every save"""
+    global _disk_cache_failed_for
+    if not FILENAME_CACHE_AVAILABLE:
+        return
+    filename_cache.configure(
+        max_entries=settings.filename_cache_size,
+        ttl=settings.filename_cache_ttl
+    )
+    path = None
+    if settings.persistent_filename_cache:
+        path = os.path.join(sublime.cache_path(), "AutoSaveWithAI", "filename_cache.sqlite3")
+        max_entries = settings.persistent_filename_cache_size
+        ttl = settings.persistent_filename_cache_ttl
+    else:
+        max_entries = settings.filename_cache_size
+        ttl = settings.filename_cache_ttl
+
+    # Set up before the disk cache so opening it loads the stored fingerprints
+    max_distance = None
+    if settings.similar_filename_cache:
+        max_distance = settings.similar_filename_max_distance
+    try:
+        filename_cache.configure_similarity(max_distance, max_entries=max_entries, ttl=ttl)
+    except ValueError as e:
+        print("AutoSaveWithAI: Invalid similar_filename_max_distance, using 6: {}".format(e))
+        filename_cache.configure_similarity(6, max_entries=max_entries, ttl=ttl)
+    if settings is _disk_cache_failed_for:
+        return
+    if not filename_cache.configure_disk(path, max_entries=max_entries, ttl=ttl):
+        _disk_cache_failed_for = settings
+
+
 def get_timestamp_filename() -> str:
     """Generate fallback filename with timestamp"""
     timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
     return "auto-notes-{}.txt".format(timestamp)
 
 
-def save_file_with_ai_name(view: sublime.View) -> bool:
+# Triggers that pick the end-to-end time budget of a save
+TRIGGER_INTERACTIVE = "interactive"  # manual command or intercepted Ctrl+S: the user is waiting
+TRIGGER_TIMER = "timer"              # background auto-save timer: nobody is waiting
+
+
+def get_time_budget(settings, trigger):
+    """Seconds a save from this trigger may spend on the LLM call (0/None = unbounded)"""
+    if trigger == TRIGGER_TIMER:
+        return settings.timer_save_deadline
+    return settings.interactive_save_deadline
+
+
+def get_token_budget(settings, model):
+    """
+    Estimated tokens the excerpt sent for model may use
+
+    The longest key of excerpt_token_budgets that model starts with wins (so both
+    "gpt-4o-mini" and "anthropic/" work as keys); otherwise excerpt_token_budget.
+    """
+    budget = settings.excerpt_token_budget
+    matched = None
+    for prefix, value in settings.excerpt_token_budgets.items():
+        if model.startswith(prefix) and (matched is None or len(prefix) > len(matched)):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                budget, matched = value, prefix
+    if budget <= 0:
+        return SETTINGS_DEFAULTS["excerpt_token_budget"]
+    return budget
+
+
+def get_compaction_rules(settings):
+    """The excerpts compaction rules named by excerpt_compaction, in order; unknown names are skipped"""
+    rules = []
+    for name in settings.excerpt_compaction:
+        rule = excerpts.COMPACTION_RULES.get(name) if isinstance(name, str) else None
+        if rule is None:
+            print("AutoSaveWithAI: Unknown excerpt_compaction rule: {}".format(name))
+        else:
+            rules.append(rule)
+    return tuple(rules)
+
+
+def get_syntax_name(view: sublime.View):
+    """Name of the view's syntax (e.g. "Python"), or None for plain text"""
+    if hasattr(view, "syntax"):
+        syntax = view.syntax()
+        name = syntax.name if syntax is not None else None
+    else:
+        # Sublime Text 3: only the path of the syntax definition
+        path = view.settings().get("syntax") or ""
+        name = os.path.splitext(os.path.basename(path))[0]
+    if not isinstance(name, str) or not name or name == "Plain Text":
+        return None
+    return name
+
+
+def record_excerpt_stats(excerpt, token_budget, report):
+    """Log the excerpt's estimated size and what compaction saved, and count both in ai_client.metrics"""
+    tokens = excerpts.estimate_tokens(excerpt)
+    print("AutoSaveWithAI: Excerpt of ~{} tokens (budget {}), compaction saved ~{} tokens {}".format(
+        tokens, token_budget, report.tokens_saved, report.saved))
+    if AI_CLIENT_AVAILABLE:
+        ai_client.metrics.increment("excerpt.tokens_sent", tokens)
+        ai_client.metrics.increment("excerpt.tokens_saved", report.tokens_saved)
+        for rule, saved in report.saved.items():
+            ai_client.metrics.increment("excerpt.tokens_saved." + rule, saved)
+
+
+def save_file_with_ai_name(view: sublime.View, trigger: str = TRIGGER_INTERACTIVE) -> bool:
     """
     Main logic to save a file with AI-generated name
     Returns True if successful, False otherwise
+
+    trigger (TRIGGER_INTERACTIVE or TRIGGER_TIMER) selects the time budget for
+    naming the file; when it runs out the timestamp fallback is used.
     """
     print("AutoSaveWithAI: Starting save process...")
 
@@ -148,8 +845,8 @@ def save_file_with_ai_name(view: sublime.View) -> bool:
         print("AutoSaveWithAI: File already has a name, skipping")
         return False
 
-    settings = get_settings()
-    save_dir = settings.get("save_directory", "")
+    settings = get_snapshot()
+    save_dir = settings.save_directory
 
     if not save_dir:
         print("AutoSaveWithAI: ERROR - save_directory not configured")
@@ -164,58 +861,89 @@ def save_file_with_ai_name(view: sublime.View) -> bool:
     # Create directory if it doesn't exist
     os.makedirs(save_dir, exist_ok=True)
 
-    # Get content
-    content = view.substr(sublime.Region(0, view.size()))
+    # Get LLM settings
+    llm_model = settings.llm_model
+    print("AutoSaveWithAI: Using LLM model: {}".format(llm_model))
 
-    if not content.strip():
+    # Fill the model's token budget with compacted text, reading only as much of the buffer as that needs
+    token_budget = get_token_budget(settings, llm_model)
+    syntax = get_syntax_name(view)
+    hint = "[Syntax: {}] ".format(syntax) if syntax and settings.excerpt_syntax_hint else ""
+    budget = max(token_budget - excerpts.estimate_tokens(hint), 1)
+    rules = get_compaction_rules(settings)
+    report = excerpts.CompactionReport(syntax)
+    excerpt = take_excerpt(view, settings.excerpt_sampling, budget, rules, report)
+    if not excerpt and rules:
+        # Compaction dropped all the text the scan reached, e.g. a file that is only a license header
+        excerpt = take_excerpt(view, settings.excerpt_sampling, budget)
+
+    if excerpt:
+        excerpt = hint + excerpt
+        record_excerpt_stats(excerpt, token_budget, report)
+    elif not excerpts.has_text(view_chunks(view)):
         print("AutoSaveWithAI: Empty file, skipping auto-save")
         return False
+    else:
+        # Text beyond the scan limit (e.g. after a long run of blank lines) still gets saved
+        print("AutoSaveWithAI: No text within the excerpt's scan limit, skipping the LLM")
 
-    # Extract first 250 words
-    excerpt = extract_first_words(content, 250)
-
-    # Get LLM settings
-    llm_model = settings.get("llm_model", "gpt-3.5-turbo")
-    print("AutoSaveWithAI: Using LLM model: {}".format(llm_model))
-
-    prompt_template = settings.get("prompt_template",
-        "Based on the following text, suggest a short, descriptive filename. "
-        "Include an appropriate file extension (.txt, .md, .json, .py, etc.) based on the content type. "
-        "Respond with ONLY the filename, nothing else.\n\nText: {content}")
+    prompt_template = settings.prompt_template
 
     # Get API configuration
-    api_base = settings.get("api_base", "https://api.openai.com/v1")
-    api_type = settings.get("api_type", "chat")
-    auth_header_name = settings.get("auth_header_name", "Authorization")
-    auth_header_prefix = settings.get("auth_header_prefix", "Bearer ")
+    api_base = settings.api_base
+    api_type = settings.api_type
+    auth_header_name = settings.auth_header_name
+    auth_header_prefix = settings.auth_header_prefix
+    stream_response = settings.stream_response
+    retry_max_attempts = settings.retry_max_attempts
+    hedge_requests = settings.hedge_requests
+    hedge_api_base = settings.hedge_api_base
+    connect_timeout = settings.connect_timeout
+    read_timeout = settings.read_timeout
 
     # Get API keys based on model
-    api_key = None
-    if llm_model.startswith("gpt-") or llm_model.startswith("openai/"):
-        api_key = settings.get("openai_api_key", None)
-        print("AutoSaveWithAI: Using OpenAI provider")
-    elif llm_model.startswith("anthropic/"):
-        api_key = settings.get("anthropic_api_key", None)
-        print("AutoSaveWithAI: Using Anthropic provider")
-    else:
-        # For other providers, check if there's a generic api_key setting
-        api_key = settings.get("api_key", None)
-        print("AutoSaveWithAI: Using provider from model string: {}".format(llm_model))
+    api_key = select_api_key(settings, llm_model)
 
     if not api_key:
         print("AutoSaveWithAI: WARNING - No API key configured")
 
-    # Try to generate filename with LLM
-    print("AutoSaveWithAI: Calling LLM to generate filename...")
-    client = AIClient(
-        model=llm_model,
-        api_key=api_key,
-        api_base=api_base,
-        api_type=api_type,
-        auth_header_name=auth_header_name,
-        auth_header_prefix=auth_header_prefix
-    )
-    ai_filename = client.generate_filename(excerpt, prompt_template)
+    configure_transport(settings)
+    configure_cache(settings)
+
+    # Identical text named before (e.g. a pasted template) reuses its name without a request
+    ai_filename = None
+    if FILENAME_CACHE_AVAILABLE and excerpt:
+        ai_filename = filename_cache.lookup(llm_model, prompt_template, excerpt)
+    if ai_filename:
+        print("AutoSaveWithAI: Reusing cached filename: {}".format(ai_filename))
+    elif excerpt:
+        endpoints = get_endpoints(settings, llm_model, api_base, api_type,
+                                  auth_header_name, auth_header_prefix) if AI_CLIENT_AVAILABLE else []
+
+        # Try to generate filename with LLM
+        print("AutoSaveWithAI: Calling LLM to generate filename...")
+        client = AIClient(
+            model=llm_model,
+            api_key=api_key,
+            api_base=api_base,
+            api_type=api_type,
+            auth_header_name=auth_header_name,
+            auth_header_prefix=auth_header_prefix,
+            stream=stream_response,
+            retry_policy=ai_client.RetryPolicy(max_attempts=retry_max_attempts) if AI_CLIENT_AVAILABLE else None,
+            hedge=hedge_requests,
+            hedge_api_bases=[hedge_api_base] if hedge_api_base else None,
+            endpoints=endpoints,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            background=trigger == TRIGGER_TIMER,
+            prompt_cache=settings.prompt_cache
+        )
+        time_budget = get_time_budget(settings, trigger)
+        print("AutoSaveWithAI: Time budget for {} save: {}s".format(trigger, time_budget))
+        ai_filename = client.generate_filename(excerpt, prompt_template, time_budget=time_budget)
+        if ai_filename and FILENAME_CACHE_AVAILABLE:
+            filename_cache.store(llm_model, prompt_template, excerpt, ai_filename)
 
     if ai_filename:
         print("AutoSaveWithAI: LLM generated filename: {}".format(ai_filename))
@@ -247,7 +975,8 @@ def save_file_with_ai_name(view: sublime.View) -> bool:
     # Save the file
     try:
         with open(full_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+            for chunk in view_chunks(view):
+                f.write(chunk)
 
         # Update view to show the new filename
         view.retarget(full_path)
@@ -284,9 +1013,7 @@ class AutoSaveEventListener(sublime_plugin.EventListener):
 
     def on_post_save_async(self, view):
         """Intercept save events if overwrite_default_save is enabled"""
-        settings = get_settings()
-
-        if not settings.get("overwrite_default_save", False):
+        if not get_snapshot().overwrite_default_save:
             return
 
         # Check if this is an unsaved file being saved
@@ -296,9 +1023,7 @@ class AutoSaveEventListener(sublime_plugin.EventListener):
 
     def on_pre_save(self, view):
         """Intercept save before it happens"""
-        settings = get_settings()
-
-        if not settings.get("overwrite_default_save", False):
+        if not get_snapshot().overwrite_default_save:
             return
 
         # Only intercept if file is unsaved (no file_name yet)
@@ -311,8 +1036,8 @@ class AutoSaveEventListener(sublime_plugin.EventListener):
 
     def on_modified_async(self, view):
         """Handle auto-save timer"""
-        settings = get_settings()
-        timer_seconds = settings.get("auto_save_timer", 0)
+        # Runs on every keystroke: one attribute read, no settings API calls
+        timer_seconds = get_snapshot().auto_save_timer
 
         if timer_seconds <= 0:
             return
@@ -344,7 +1069,7 @@ class AutoSaveEventListener(sublime_plugin.EventListener):
                 return
 
             print("AutoSaveWithAI: Timer triggered auto-save")
-            save_file_with_ai_name(view)
+            save_file_with_ai_name(view, TRIGGER_TIMER)
 
             # Remove timer reference
             if view_id in self.timers:
@@ -358,3 +1083,49 @@ class AutoSaveEventListener(sublime_plugin.EventListener):
         view_id = view.id()
         if view_id in self.timers:
             del self.timers[view_id]
+
+
+def get_api_bases(settings):
+    """Every distinct API base URL the settings may send requests to"""
+    api_bases = [settings.api_base, settings.hedge_api_base]
+    for entry in settings.endpoints or ():
+        if isinstance(entry, dict):
+            api_bases.append(entry.get("api_base"))
+    unique = []
+    for api_base in api_bases:
+        if api_base and api_base not in unique:
+            unique.append(api_base)
+    return unique
+
+
+def prewarm_connections(settings):
+    """Resolve and connect to every configured endpoint so the first save takes the warm path"""
+    connect_timeout = settings.connect_timeout
+    for api_base in get_api_bases(settings):
+        try:
+            ai_client.prewarm_connection(api_base, timeout=connect_timeout)
+            print("AutoSaveWithAI: Prewarmed connection to {}".format(api_base))
+        except Exception as e:
+            print("AutoSaveWithAI: Could not prewarm {}: {}".format(api_base, e))
+
+
+def plugin_loaded():
+    """Apply transport settings and warm up API connections in the background"""
+    if not AI_CLIENT_AVAILABLE:
+        return
+    settings = get_snapshot()
+    configure_transport(settings)
+    configure_cache(settings)
+    if settings.prewarm_connections:
+        sublime.set_timeout_async(lambda: prewarm_connections(settings), 0)
+
+
+def plugin_unloaded():
+    """Close pooled API connections and the filename cache when the plugin is unloaded or reloaded"""
+    global _snapshot
+    get_settings().clear_on_change(SETTINGS_LISTENER_KEY)
+    _snapshot = None
+    if AI_CLIENT_AVAILABLE:
+        ai_client.close_connections()
+    if FILENAME_CACHE_AVAILABLE:
+        filename_cache.close()
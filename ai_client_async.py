@@ -0,0 +1,257 @@
+# ABOUTME: asyncio-native Chat Completions and Responses calls built on asyncio streams
+# ABOUTME: Separate from ai_client because async/await syntax needs Python 3.5+ (the 3.3 plugin host can't parse it)
+
+import asyncio
+import time
+import weakref
+
+try:
+    from . import ai_client
+except ImportError:
+    import ai_client
+
+# Same error type as the blocking client, re-exported for callers
+OpenAIHTTPError = ai_client.OpenAIHTTPError
+
+
+class _AsyncConnection:
+    """One keep-alive HTTP/1.1 stream pair"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.monotonic()
+
+    def is_usable(self, idle_timeout):
+        if time.monotonic() - self.last_used > idle_timeout:
+            return False
+        # EOF on an idle connection means the server closed it while it sat in the pool
+        return not (self.reader.at_eof() or self.writer.is_closing())
+
+    def close(self):
+        self.writer.close()
+
+
+class _AsyncConnectionPool:
+    """
+    Keep-alive connection pool for one event loop.
+
+    Like ai_client.ConnectionPool, but without proxy support: connections are keyed by
+    (scheme, netloc) and shared by calls with different timeouts, idle ones expire after
+    idle_timeout seconds and at most max_per_host are open per key.
+    """
+
+    def __init__(self, max_per_host=100, idle_timeout=60.0):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self._idle = {}     # key -> list of _AsyncConnection
+        self._slots = {}    # key -> asyncio.Semaphore
+
+    async def acquire(self, key, factory):
+        """Return (conn, reused), waiting while max_per_host connections are busy"""
+        slots = self._slots.get(key)
+        if slots is None:
+            slots = self._slots[key] = asyncio.Semaphore(self.max_per_host)
+        await slots.acquire()
+
+        idle = self._idle.get(key)
+        while idle:
+            conn = idle.pop()
+            if conn.is_usable(self.idle_timeout):
+                return conn, True
+            conn.close()
+
+        try:
+            return await factory(), False
+        except BaseException:
+            slots.release()
+            raise
+
+    def release(self, key, conn):
+        conn.last_used = time.monotonic()
+        self._idle.setdefault(key, []).append(conn)
+        self._slots[key].release()
+
+    def discard(self, key, conn):
+        conn.close()
+        self._slots[key].release()
+
+    def close_all(self):
+        for idle in self._idle.values():
+            for conn in idle:
+                conn.close()
+        self._idle.clear()
+
+
+# Streams belong to the loop that created them, so each loop gets its own pool
+_pools = weakref.WeakKeyDictionary()
+
+
+def _get_pool():
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = _pools[loop] = _AsyncConnectionPool()
+    return pool
+
+
+async def aclose_connections():
+    """Close all idle pooled connections of the running event loop"""
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        pool.close_all()
+
+
+async def _open_connection(parsed):
+    host = parsed.hostname
+    if parsed.scheme == "https":
+        port = parsed.port or 443
+        reader, writer = await asyncio.open_connection(
+            host, port, ssl=ai_client.get_ssl_context(), server_hostname=host
+        )
+    else:
+        port = parsed.port or 80
+        reader, writer = await asyncio.open_connection(host, port)
+    return _AsyncConnection(reader, writer)
+
+
+async def _read_response(reader):
+    """
+    Read one HTTP/1.1 response.
+
+    Returns:
+        Tuple (status, headers dict with lower-case names, body bytes, keep_alive)
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("Server closed the connection before responding")
+    parts = status_line.decode("latin-1").split(None, 2)
+    if len(parts) < 2 or not parts[0].startswith("HTTP/") or not parts[1].isdigit():
+        raise OpenAIHTTPError("Malformed HTTP status line: {}".format(repr(status_line)))
+    version, status = parts[0], int(parts[1])
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+    limit = ai_client._max_response_bytes
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        total = 0
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+            total += size
+            if total > limit:
+                raise ai_client.ResponseTooLargeError("Response exceeds the {} byte limit".format(limit))
+            if size == 0:
+                # Skip trailers up to the blank line
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        body = b"".join(chunks)
+    elif "content-length" in headers:
+        length = int(headers["content-length"])
+        if length > limit:
+            raise ai_client.ResponseTooLargeError(
+                "Response of {} bytes exceeds the {} byte limit".format(length, limit)
+            )
+        body = await reader.readexactly(length)
+    else:
+        # Body runs until EOF
+        chunks = []
+        total = 0
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > limit:
+                raise ai_client.ResponseTooLargeError("Response exceeds the {} byte limit".format(limit))
+            chunks.append(chunk)
+        body = b"".join(chunks)
+        keep_alive = False
+
+    return status, headers, body, keep_alive
+
+
+async def _asend(parsed, method, request_path, body_bytes, headers):
+    """Async counterpart of ai_client._send(); returns (status, headers, body bytes)"""
+    pool = _get_pool()
+    key = (parsed.scheme, parsed.netloc)
+
+    lines = ["{} {} HTTP/1.1".format(method, request_path), "Host: {}".format(parsed.netloc)]
+    send_headers = dict(headers)
+    send_headers.setdefault("Content-Length", str(len(body_bytes)))
+    for name, value in send_headers.items():
+        lines.append("{}: {}".format(name, value))
+    head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    while True:
+        conn, reused = await pool.acquire(key, lambda: _open_connection(parsed))
+        try:
+            conn.writer.write(head + body_bytes)
+            await conn.writer.drain()
+            status, resp_headers, resp_bytes, keep_alive = await _read_response(conn.reader)
+            resp_bytes = ai_client._decode_content(resp_headers.get("content-encoding"), resp_bytes)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pool.discard(key, conn)
+            if reused:
+                continue
+            raise
+        except BaseException:
+            pool.discard(key, conn)
+            raise
+
+        if keep_alive:
+            pool.release(key, conn)
+        else:
+            pool.discard(key, conn)
+        return status, resp_headers, resp_bytes
+
+
+async def _apost_json(base_url, path, body, headers, timeout=30):
+    """
+    Async version of ai_client._post_json().
+    Raises OpenAIHTTPError on HTTP >= 400 or invalid JSON, asyncio.TimeoutError on timeout.
+    """
+    parsed, request_path, body_bytes, headers = ai_client._build_request(base_url, path, body, headers)
+    status, resp_headers, resp_bytes = await asyncio.wait_for(
+        _asend(parsed, "POST", request_path, body_bytes, headers), timeout
+    )
+    return ai_client._decode_response(status, resp_bytes, request_path, resp_headers.get("retry-after"))
+
+
+async def achat_completion(base_url, api_key, model, messages, max_tokens=None, temperature=None,
+                           auth_header_name="Authorization", auth_header_prefix="Bearer ", prompt_cache_key=None,
+                           timeout=30):
+    """
+    Call /v1/chat/completions on an OpenAI-compatible server without blocking the event loop.
+    The request arguments and return value match ai_client.chat_completion(); there are
+    no retries, deadlines, proxies or rate limits, only timeout (seconds for the whole
+    call, then asyncio.TimeoutError).
+    """
+    headers = ai_client._auth_headers(api_key, auth_header_name, auth_header_prefix)
+    body = ai_client._chat_body(model, messages, max_tokens, temperature, prompt_cache_key)
+    return ai_client._record_usage(await _apost_json(base_url, "/chat/completions", body, headers, timeout))
+
+
+async def aresponses_create(base_url, api_key, model, input_value, max_output_tokens=None, temperature=None,
+                            auth_header_name="Authorization", auth_header_prefix="Bearer ", prompt_cache_key=None,
+                            timeout=30):
+    """
+    Call /v1/responses on an OpenAI-compatible server without blocking the event loop.
+    Request arguments, timeout and return value as for achat_completion(), matching
+    ai_client.responses_create().
+    """
+    headers = ai_client._auth_headers(api_key, auth_header_name, auth_header_prefix)
+    body = ai_client._responses_body(model, input_value, max_output_tokens, temperature, prompt_cache_key)
+    return ai_client._record_usage(await _apost_json(base_url, "/responses", body, headers, timeout))
@@ -0,0 +1,85 @@
+# ABOUTME: Benchmark of excerpt extraction from large buffers: full copy and split vs chunked lazy reads
+# ABOUTME: Times each on prose, log and space-free (base64-like and CJK) buffers of the given size
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import excerpts
+
+
+def full_split(buffer, word_limit):
+    """What the plugin did before: copy the whole buffer, then split all of it"""
+    text = buffer[0:len(buffer)]
+    return ' '.join(text.split()[:word_limit])
+
+
+def chunked(buffer, word_limit):
+    return excerpts.first_words(excerpts.iter_chunks(lambda begin, end: buffer[begin:end], len(buffer)), word_limit)
+
+
+def token_budget(buffer, word_limit):
+    """What the plugin does now: chunked reads cut at an estimated 400-token budget"""
+    return excerpts.first_tokens(excerpts.iter_chunks(lambda begin, end: buffer[begin:end], len(buffer)), 400)
+
+
+def sampled(buffer, word_limit):
+    """Head/middle/tail sampling within the same 400-token budget"""
+    return excerpts.sample_tokens(lambda begin, end: buffer[begin:end], len(buffer), 400)
+
+
+def compacted(buffer, word_limit):
+    """Sampling with the default compaction rules, as the plugin sends it"""
+    rules = [excerpts.COMPACTION_RULES[name] for name in
+             ("drop_license_headers", "dedupe_log_prefixes", "collapse_whitespace")]
+    return excerpts.sample_tokens(lambda begin, end: buffer[begin:end], len(buffer), 400, rules)
+
+
+def measure(extract, buffer, word_limit):
+    """(milliseconds, peak MiB allocated, excerpt) for one extraction"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    excerpt = extract(buffer, word_limit)
+    elapsed = (time.perf_counter() - start) * 1000.0
+    peak = tracemalloc.get_traced_memory()[1] / 1048576.0
+    tracemalloc.stop()
+    return elapsed, peak, excerpt
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Excerpt extraction cost on large buffers")
+    parser.add_argument("--mb", type=int, default=50, help="buffer size in MiB")
+    parser.add_argument("-w", "--words", type=int, default=250)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    size = args.mb * 1048576
+    vocabulary = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9))) for _ in range(2000)]
+    prose = " ".join(rng.choice(vocabulary) for _ in range(size // 6))[:size]
+    base64ish = "".join(rng.choice(string.ascii_letters + string.digits + "+/") for _ in range(4096)) * (size // 4096)
+    # Han characters and kana without spaces, as in Chinese or Japanese documents
+    cjk = "".join(chr(rng.choice((rng.randint(0x4e00, 0x9fff), rng.randint(0x3041, 0x3093)))) for _ in range(4096))
+    cjk = cjk * (size // 4096)
+
+    # Application log: timestamps, levels and sources repeat on every line
+    log_lines = ["2024-01-15T10:{:02d}:{:02d}.{:03d}Z INFO [worker-{}] processed order {} in {}ms\n".format(
+        i // 3600 % 60, i // 60 % 60, i % 1000, i % 4, i, rng.randint(1, 900)) for i in range(20000)]
+    log = "".join(log_lines) * (size // len("".join(log_lines)) + 1)
+
+    for label, buffer in (("prose", prose), ("base64", base64ish), ("cjk", cjk), ("log", log[:size])):
+        for name, extract in (("full split", full_split), ("chunked", chunked), ("token budget", token_budget),
+                              ("sampled", sampled), ("compacted", compacted)):
+            elapsed, peak, excerpt = measure(extract, buffer, args.words)
+            print("{:<8} {:<12} {:10.2f} ms  peak {:8.2f} MiB  excerpt {:>7} chars  {:>4} words".format(
+                label, name, elapsed, peak, len(excerpt), len(excerpt.split())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# ABOUTME: Benchmark of filename cache lookups (in-memory LRU, SQLite, SimHash index) on the save path
+# ABOUTME: Fills temporary caches with N entries and times hit and miss lookups
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import filename_cache
+
+TEMPLATE = "Suggest a filename.\n\nText: {content}"
+
+
+def excerpt(i):
+    return "Meeting notes {} agenda budget timeline owners follow-up items for week {}".format(i, i % 52)
+
+
+def time_lookups(get, keys):
+    """Mean microseconds per get(key)"""
+    start = time.perf_counter()
+    for key in keys:
+        get(key)
+    return (time.perf_counter() - start) / len(keys) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Filename cache lookup latency")
+    parser.add_argument("-n", "--entries", type=int, default=10000)
+    parser.add_argument("-l", "--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    keys = [filename_cache.cache_key("bench-model", TEMPLATE, excerpt(i)) for i in range(args.entries)]
+    hit_keys = [keys[i % args.entries] for i in range(0, args.lookups * 7, 7)]
+    miss_keys = [filename_cache.cache_key("bench-model", TEMPLATE, "missing {}".format(i)) for i in range(args.lookups)]
+
+    start = time.perf_counter()
+    for i in range(args.lookups):
+        filename_cache.cache_key("bench-model", TEMPLATE, excerpt(i))
+    print("{:<16} {:8.2f} us".format("hash", (time.perf_counter() - start) / args.lookups * 1e6))
+
+    memory = filename_cache.FilenameCache(max_entries=args.entries)
+    for key in keys:
+        memory.put(key, "name.txt")
+    print("{:<16} {:8.2f} us".format("memory hit", time_lookups(memory.get, hit_keys)))
+    print("{:<16} {:8.2f} us".format("memory miss", time_lookups(memory.get, miss_keys)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        disk = filename_cache.DiskFilenameCache(os.path.join(directory, "names.sqlite3"), max_entries=args.entries)
+        disk._db.execute("BEGIN")
+        for key in keys:
+            disk._db.execute("INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?, NULL, NULL)",
+                             (key, "name.txt", time.time(), 0.0))
+        disk._db.execute("COMMIT")
+        print("{:<16} {:8.2f} us  (first hit per key rewrites its last-used time)".format(
+            "disk hit", time_lookups(disk.get, hit_keys)))
+        print("{:<16} {:8.2f} us".format("disk hit (warm)", time_lookups(disk.get, hit_keys)))
+        print("{:<16} {:8.2f} us".format("disk miss", time_lookups(disk.get, miss_keys)))
+        disk.close()
+
+    # Near-duplicates: random texts over a shared vocabulary, then lightly edited copies
+    rng = random.Random(0)
+    vocabulary = ["word{}".format(i) for i in range(5000)]
+    texts = [" ".join(rng.choice(vocabulary) for _ in range(60)) for _ in range(args.entries)]
+    start = time.perf_counter()
+    fingerprints = [filename_cache.simhash(text) for text in texts]
+    print("{:<16} {:8.2f} us".format("simhash", (time.perf_counter() - start) / len(texts) * 1e6))
+    index = filename_cache.SimilarityIndex(max_entries=args.entries)
+    for fingerprint in fingerprints:
+        index.add("scope", fingerprint, "name.txt")
+    edited = []
+    for text in texts[:args.lookups]:
+        words = text.split()
+        words[rng.randrange(len(words))] = "edited"
+        edited.append(filename_cache.simhash(" ".join(words)))
+    print("{:<16} {:8.2f} us".format("similar (edited)", time_lookups(lambda f: index.nearest("scope", f), edited)))
+    misses = [rng.getrandbits(64) for _ in range(args.lookups)]
+    print("{:<16} {:8.2f} us".format("similar miss", time_lookups(lambda f: index.nearest("scope", f), misses)))
+    print("{:<16} {:8.1f} %".format("similar recall", 100.0 * index.hits / len(edited)))
+
+
+if __name__ == "__main__":
+    main()
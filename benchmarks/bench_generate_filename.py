@@ -0,0 +1,105 @@
+# ABOUTME: End-to-end AIClient.generate_filename latency under realistic API latency and injected faults
+# ABOUTME: Drives the fake OpenAI server (in a subprocess by default), no network or API key required
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import threading
+import time
+from unittest.mock import MagicMock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+sys.modules.setdefault("sublime", MagicMock())
+sys.modules.setdefault("sublime_plugin", MagicMock())
+
+import ai_client
+from AutoSaveWithAI import AIClient
+from tests.fake_openai_server import FakeOpenAIServer, start_subprocess
+
+PROMPT = "Suggest a short filename with an extension. Respond with ONLY the filename.\n\nText: {content}"
+
+
+def run(client, iterations, concurrency, time_budget):
+    """Issue iterations saves from concurrency threads; returns (sorted ms samples, failures)"""
+    samples = []
+    failures = [0]
+    lock = threading.Lock()
+    counter = iter(range(iterations))
+
+    def worker():
+        for i in counter:
+            start = time.perf_counter()
+            result = client.generate_filename("Benchmark note number {}".format(i), PROMPT, time_budget)
+            elapsed = (time.perf_counter() - start) * 1000.0
+            with lock:
+                samples.append(elapsed)
+                if not result:
+                    failures[0] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(samples), failures[0]
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="generate_filename latency against the fake API server")
+    parser.add_argument("-n", "--iterations", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, default=4)
+    parser.add_argument("--latency", default="lognormal:0.05:0.5", help="server latency spec")
+    parser.add_argument("--fault", action="append", default=[], metavar="KIND=PROBABILITY",
+                        help="e.g. 429=0.05, 500=0.02, reset=0.01, slowloris=0.01")
+    parser.add_argument("--api-type", choices=("chat", "responses"), default="chat")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--hedge", action="store_true")
+    parser.add_argument("--time-budget", type=float, default=8.0)
+    parser.add_argument("--in-process", action="store_true", help="run the server on a thread instead")
+    args = parser.parse_args()
+
+    if args.in_process:
+        faults = dict((kind, float(p)) for kind, _, p in (f.partition("=") for f in args.fault))
+        server = FakeOpenAIServer(latency=args.latency, faults=faults, slowloris_interval=0.05).start()
+        base_url, stop = server.base_url, server.stop
+    else:
+        server_args = ["--latency", args.latency]
+        for fault in args.fault:
+            server_args += ["--fault", fault]
+        process, base_url = start_subprocess(*server_args)
+        stop = process.terminate
+
+    client = AIClient(model="bench-model", api_key="bench-key", api_base=base_url, api_type=args.api_type,
+                      stream=args.stream, hedge=args.hedge,
+                      retry_policy=ai_client.RetryPolicy(max_attempts=3, backoff_base=0.05))
+    try:
+        # The plugin logs every call; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            run(client, 5, 1, args.time_budget)
+            ai_client.metrics.reset()
+            samples, failures = run(client, args.iterations, args.concurrency, args.time_budget)
+    finally:
+        ai_client.close_connections()
+        stop()
+
+    print("n={} concurrency={} failures={}".format(len(samples), args.concurrency, failures))
+    print("p50={:8.2f} ms  p90={:8.2f} ms  p99={:8.2f} ms  max={:8.2f} ms".format(
+        percentile(samples, 0.5), percentile(samples, 0.9), percentile(samples, 0.99), samples[-1]
+    ))
+    snapshot = ai_client.metrics.snapshot()
+    for name, value in sorted(snapshot["counters"].items()):
+        print("{:<32} {}".format(name, value))
+    for name, timing in sorted(snapshot["timings"].items()):
+        print("{:<32} count={} mean={:.4f}s max={:.4f}s".format(name, timing["count"], timing["mean"], timing["max"]))
+
+
+if __name__ == "__main__":
+    main()
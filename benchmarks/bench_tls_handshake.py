@@ -0,0 +1,59 @@
+# ABOUTME: Benchmark comparing cold TLS handshakes with resumed TLS sessions in ai_client
+# ABOUTME: Runs against a local TLS stand-in server, no network or API key required
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import ai_client
+from tests.fake_openai_server import FakeOpenAIServer
+
+KEYCERT = os.path.join(ROOT, "tests", "keycert.pem")
+
+
+def run(base_url, iterations, resume):
+    """Time one request per iteration, each on a brand new socket"""
+    samples = []
+    for _ in range(iterations):
+        ai_client.close_connections()
+        if not resume:
+            ai_client._tls_sessions.clear()
+        start = time.perf_counter()
+        ai_client.chat_completion(base_url, "bench-key", "bench-model",
+                                  [{"role": "user", "content": "hi"}])
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return sorted(samples)
+
+
+def report(label, samples):
+    p50 = samples[len(samples) // 2]
+    p90 = samples[min(len(samples) - 1, int(len(samples) * 0.9))]
+    print("{:<10} n={:<4} p50={:7.2f} ms  p90={:7.2f} ms".format(label, len(samples), p50, p90))
+    return p50
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold vs resumed TLS handshake latency")
+    parser.add_argument("-n", "--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(certfile=KEYCERT).start()
+    base_url = server.base_url
+    ai_client.configure_ssl(cafile=KEYCERT)
+    try:
+        # Warm up imports and the server's ticket keys
+        run(base_url, 3, resume=True)
+        cold = report("cold", run(base_url, args.iterations, resume=False))
+        resumed = report("resumed", run(base_url, args.iterations, resume=True))
+        print("speedup    {:.2f}x".format(cold / resumed if resumed else float("inf")))
+    finally:
+        ai_client.close_connections()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
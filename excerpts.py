@@ -0,0 +1,578 @@
+# ABOUTME: Builds the text excerpt sent to the LLM without copying or splitting the whole buffer
+# ABOUTME: Reads bounded chunks, compacts and tokenizes lazily, and fills an estimated token budget
+
+import itertools
+import math
+import re
+
+# Characters read from the buffer per call; large enough that typical files take one read
+CHUNK_CHARS = 65536
+
+# Runs without whitespace (base64, minified code) longer than this are cut into pieces of
+# this length, so a space-free buffer can't turn into one unbounded "word"
+MAX_WORD_CHARS = 256
+
+_WORD_RE = re.compile(r"\S+")
+
+
+def iter_chunks(read, size, chunk_chars=CHUNK_CHARS, start=0):
+    """
+    Read [start, size) in consecutive pieces of at most chunk_chars characters
+
+    Args:
+        read: Callable (begin, end) -> str, e.g. a wrapper around view.substr
+        size: Number of characters available
+        chunk_chars: Characters per read
+        start: Position of the first character to read
+
+    Returns:
+        Generator of strings; nothing is read until it is iterated
+    """
+    position = start
+    while position < size:
+        end = min(position + chunk_chars, size)
+        yield read(position, end)
+        position = end
+
+
+# CJK ranges shared by segmentation and token estimation, so both classify the same
+# characters: radicals, CJK punctuation, kana, bopomofo, Han, and fullwidth and halfwidth forms
+_CJK = (r"\u2e80-\u2fdf\u3000-\u303f\u3040-\u30ff\u3100-\u312f\u31f0-\u31ff\u3400-\u4dbf"
+        r"\u4e00-\u9fff\uf900-\ufaff\uff01-\uff9f\U00020000-\U0003134f")
+# Hangul: as dense in tokens as Han, but Korean separates its words with spaces
+_HANGUL = r"\u1100-\u11ff\u3130-\u318f\uac00-\ud7af"
+# Scripts written without spaces between words: the CJK ranges, Thai, Lao, Tibetan,
+# Myanmar and Khmer. Text in them is counted one grapheme at a time.
+_SPACE_FREE = _CJK + r"\u0e00-\u0eff\u0f00-\u0fff\u1000-\u109f\u1780-\u17ff"
+# Combining marks that belong to the preceding character: Latin diacritics, Thai, Lao,
+# Tibetan, Myanmar and Khmer vowel and tone marks, kana voicing marks, variation selectors
+_MARKS = (r"\u0300-\u036f\u0e31\u0e34-\u0e3a\u0e47-\u0e4e\u0eb1\u0eb4-\u0ebc\u0ec8-\u0ecd"
+          r"\u0f71-\u0f84\u102b-\u103e\u1056-\u1059\u17b4-\u17d3\u200d\u3099\u309a\ufe00-\ufe0f")
+# A grapheme of a space-free script, or a run of anything else (a word or part of one)
+_SEGMENT_RE = re.compile(r"[" + _SPACE_FREE + r"][" + _MARKS + r"]*|[^" + _SPACE_FREE + r"]+")
+
+
+def _segments(word, glued):
+    """
+    (unit, glued) pairs of one whitespace-free word
+
+    Space-free scripts give one unit per grapheme, so Chinese with English words
+    inside yields each Han character and each English word as a unit. Other runs
+    longer than MAX_WORD_CHARS are cut into pieces. glued is True when the unit
+    continues the previous one without whitespace in between; the first unit
+    takes glued as given.
+    """
+    for match in _SEGMENT_RE.finditer(word):
+        unit = match.group()
+        for start in range(0, len(unit), MAX_WORD_CHARS):
+            yield unit[start:start + MAX_WORD_CHARS], glued
+            glued = True
+
+
+def iter_segments(chunks):
+    """
+    (unit, glued) pairs of the concatenated chunks, found one at a time
+
+    Units are whitespace-separated words, except that text in space-free scripts is
+    split into graphemes and runs longer than MAX_WORD_CHARS into pieces; glued
+    marks units that directly continue the previous one. A word cut by a chunk
+    boundary is joined with its rest from the next chunk, and the carried-over text
+    never exceeds MAX_WORD_CHARS.
+    """
+    carry = ""
+    glued = False  # whether carry continues a word already partly yielded
+    for chunk in chunks:
+        text = carry + chunk if carry else chunk
+        # The word still being read at the end of the chunk may continue in the next one;
+        # rsplit finds it from the right in C instead of rescanning the chunk
+        cut = len(text) if not text or text[-1].isspace() else len(text) - len(text.rsplit(None, 1)[-1])
+        for match in _WORD_RE.finditer(text, 0, cut):
+            for segment in _segments(match.group(), glued and match.start() == 0):
+                yield segment
+        if cut:
+            glued = False
+        start = cut
+        while len(text) - start > MAX_WORD_CHARS:
+            for segment in _segments(text[start:start + MAX_WORD_CHARS], glued):
+                yield segment
+            start += MAX_WORD_CHARS
+            glued = True
+        carry = text[start:]
+    if carry:
+        for segment in _segments(carry, glued):
+            yield segment
+
+
+def iter_words(chunks):
+    """Units of iter_segments without their glued flags"""
+    for unit, _ in iter_segments(chunks):
+        yield unit
+
+
+def join_segments(segments):
+    """Text of (unit, glued) pairs: glued units are appended directly, others after a space"""
+    return "".join(unit if glued else " " + unit for unit, glued in segments)[1:]
+
+
+def has_text(chunks):
+    """Whether chunks hold anything but whitespace; stops reading at the first chunk that does"""
+    return any(chunk and not chunk.isspace() for chunk in chunks)
+
+
+def first_words(chunks, word_limit=250):
+    """
+    The first word_limit units of chunks (words, or graphemes of space-free scripts),
+    with single spaces where the text had whitespace
+
+    Stops pulling chunks as soon as the limit is reached, so only the start of a
+    large buffer is ever read.
+    """
+    return join_segments(itertools.islice(iter_segments(chunks), word_limit))
+
+
+# Characters per token for each kind of run, approximating the BPE vocabularies of current
+# OpenAI and Anthropic models. Errors lean towards overestimating, so a budget is a ceiling.
+CHARS_PER_TOKEN = {
+    "latin": 5.0,   # ASCII letters: common words are one token, long identifiers split
+    "digits": 3.0,  # digits are merged in groups of at most three
+    "cjk": 1.0,     # Han, kana and Hangul: about one token per character
+    "other": 2.0,   # accented Latin, Cyrillic, Greek, Arabic, Indic and other scripts
+    "symbols": 2.0, # punctuation and operators; pairs like '":' or '->' usually merge
+    "data": 1.7,    # base64, hex and hash-like runs, whose letters rarely form known tokens
+}
+
+_RUN_KINDS = ("latin", "digits", "cjk", "other", "symbols")
+_RUN_RE = re.compile(
+    r"([A-Za-z]+)|([0-9]+)|([" + _CJK + _HANGUL + r"]+)|([^\x00-\x7f" + _CJK + _HANGUL + r"]+)"
+    r"|([\x00-\x2f\x3a-\x40\x5b-\x60\x7b-\x7f]+)"
+)
+# Whole words that are encoded data rather than language: base64 or long hex strings
+_DATA_RE = re.compile(r"(?=.*[0-9])(?=.*[A-Za-z])[A-Za-z0-9+/=_-]{20,}\Z|[0-9a-fA-F]{16,}\Z")
+
+
+def _word_tokens(word):
+    """Estimated tokens of one whitespace-free word; at least one per run of a kind"""
+    if _DATA_RE.match(word):
+        return int(math.ceil(len(word) / CHARS_PER_TOKEN["data"]))
+    tokens = 0
+    for match in _RUN_RE.finditer(word):
+        tokens += int(math.ceil((match.end() - match.start()) / CHARS_PER_TOKEN[_RUN_KINDS[match.lastindex - 1]]))
+    return tokens
+
+
+def estimate_tokens(text):
+    """
+    Estimate how many tokens text costs, without a tokenizer vocabulary
+
+    Each unit (see iter_segments) is split into runs of Latin letters, digits, CJK,
+    other scripts and symbols, and each run is charged by the CHARS_PER_TOKEN ratio
+    of its kind. Encoded data (base64, hex) is charged as a whole. The work is a
+    regex scan, a few microseconds per word.
+    """
+    return sum(_word_tokens(unit) for unit, _ in iter_segments([text]))
+
+
+def first_tokens(chunks, token_budget, rules=(), report=None):
+    """
+    The leading units of chunks whose estimated tokens fit in token_budget, with single
+    spaces where the text had whitespace
+
+    Like first_words, this stops pulling chunks once the budget is spent. The unit
+    that overflows the budget is halved until it fits, so a long first word still
+    yields an excerpt. With compaction rules the text is read line by line and
+    compacted first (see compact_lines). At most SCAN_CHARS_PER_TOKEN characters per
+    token are read, so text the rules drop (or blank space) can't make it read the
+    whole buffer.
+    """
+    chunks = _counted(chunks, [0], max(token_budget * SCAN_CHARS_PER_TOKEN, 1))
+    if rules:
+        lines = compact_lines(iter_lines(chunks), rules, report)
+        segments_in = ((unit, glued) for line in lines for unit, glued, _ in _line_units(line))
+    else:
+        segments_in = iter_segments(chunks)
+    segments = []
+    spent = 0
+    for unit, glued in segments_in:
+        tokens = _word_tokens(unit)
+        if spent + tokens > token_budget:
+            while unit and spent + _word_tokens(unit) > token_budget:
+                unit = unit[:len(unit) // 2]
+            if unit:
+                segments.append((unit, glued))
+            break
+        spent += tokens
+        segments.append((unit, glued))
+    return join_segments(segments)
+
+
+# Lines longer than this (minified code, one-line JSON) are handled in pieces of this length
+MAX_LINE_CHARS = 1024
+
+# Characters a section may scan per token of its budget, so text made of repeated lines
+# can't make sampling read the whole buffer
+SCAN_CHARS_PER_TOKEN = 32
+
+# Shares of the token budget for the start and middle of a document; the tail gets the rest
+HEAD_SHARE = 0.5
+MIDDLE_SHARE = 0.25
+
+# Placed between sections so the model can tell the excerpt skips text
+GAP_MARKER = "..."
+
+
+def iter_lines(chunks):
+    """Lines of the concatenated chunks with their line endings, in pieces of at most MAX_LINE_CHARS"""
+    carry = ""
+    for chunk in chunks:
+        text = carry + chunk if carry else chunk
+        cut = text.rfind("\n") + 1
+        for line in text[:cut].splitlines(True):
+            for start in range(0, len(line), MAX_LINE_CHARS):
+                yield line[start:start + MAX_LINE_CHARS]
+        start = cut
+        while len(text) - start > MAX_LINE_CHARS:
+            yield text[start:start + MAX_LINE_CHARS]
+            start += MAX_LINE_CHARS
+        carry = text[start:]
+    if carry:
+        yield carry
+
+
+def _line_units(line):
+    """(unit, glued, tokens) triples of one line, found one at a time"""
+    for match in _WORD_RE.finditer(line):
+        for unit, glued in _segments(match.group(), False):
+            yield unit, glued, _word_tokens(unit)
+
+
+def _counted(pieces, consumed, limit):
+    """
+    Pass pieces of text through, adding their lengths to consumed[0], until consumed[0]
+    reaches limit; the check comes before the next piece is pulled, so nothing is read
+    past the limit
+    """
+    pieces = iter(pieces)
+    while consumed[0] < limit:
+        piece = next(pieces, None)
+        if piece is None:
+            return
+        consumed[0] += len(piece)
+        yield piece
+
+
+def _section_lines(read, size, chunk_chars, start, mid_line, rules, report, consumed, scan_chars):
+    """
+    Compacted lines of the document from start on; consumed[0] counts the characters
+    read before compaction, so the next section can start after them, and reading
+    stops once it reaches scan_chars
+
+    mid_line: start may fall inside a line, whose rest is then skipped
+    """
+    lines = iter_lines(iter_chunks(read, size, chunk_chars, start))
+    if mid_line:
+        consumed[0] += len(next(lines, ""))
+    return compact_lines(_counted(lines, consumed, scan_chars), rules, report)
+
+
+def _take_lines(lines, token_budget, seen, line_ends=None):
+    """
+    Units of lines, in order, while they fit in token_budget; blank lines and lines
+    whose stripped text is in seen are skipped, the others are added to seen
+
+    line_ends: If given, gets (stripped text, number of units so far) for each line taken whole
+
+    Returns:
+        (units, spent, fits): (unit, glued, tokens) triples, tokens used, and whether
+        lines ran out before the budget
+    """
+    units = []
+    spent = 0
+    for line in lines:
+        key = line.strip()
+        if key and key not in seen:
+            seen.add(key)
+            for unit in _line_units(line):
+                if spent + unit[2] > token_budget:
+                    return units, spent, False
+                units.append(unit)
+                spent += unit[2]
+            if line_ends is not None:
+                line_ends.append((key, len(units)))
+    return units, spent, True
+
+
+def _take_last_lines(lines, token_budget, seen):
+    """Like _take_lines from the end of lines backwards; returns (units in text order, spent)"""
+    picked = []
+    spent = 0
+    for line in reversed(lines):
+        key = line.strip()
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        units = list(_line_units(line))
+        cost = sum(unit[2] for unit in units)
+        if spent + cost > token_budget:
+            # The last units of the line that still fit; the cut one can't be glued to anything
+            kept = []
+            for unit in reversed(units):
+                if spent + unit[2] > token_budget:
+                    break
+                kept.append(unit)
+                spent += unit[2]
+            if kept:
+                kept[-1] = (kept[-1][0], False, kept[-1][2])
+                picked.append(kept[::-1])
+            break
+        picked.append(units)
+        spent += cost
+    return [unit for units in reversed(picked) for unit in units], spent
+
+
+def _join_units(units):
+    return join_segments((unit, glued) for unit, glued, _ in units)
+
+
+def sample_tokens(read, size, token_budget, rules=(), report=None):
+    """
+    Excerpt of a document that fits in token_budget, sampled from its start, middle and end
+
+    Documents whose distinct lines fit in the budget are returned whole. Longer ones
+    get HEAD_SHARE of the budget from the start, MIDDLE_SHARE from lines after the
+    midpoint and the rest from the last lines, joined by GAP_MARKER. Blank and repeated
+    lines (separators, identical log lines) are dropped throughout. Each section scans
+    at most SCAN_CHARS_PER_TOKEN characters per token, so reads stay bounded.
+
+    Args:
+        read: Callable (begin, end) -> str
+        size: Number of characters in the document
+        token_budget: Estimated tokens the excerpt may use
+        rules: Compaction rules applied to the lines before they are counted
+        report: CompactionReport collecting what the rules saved, or None
+
+    Returns:
+        The excerpt, with single spaces where the text had whitespace
+    """
+    seen = set()
+    scan_chars = max(token_budget * SCAN_CHARS_PER_TOKEN, 1)
+    # Read no more per call than a section may scan
+    chunk_chars = min(CHUNK_CHARS, scan_chars)
+    consumed = [0]
+    lines = _section_lines(read, size, chunk_chars, 0, False, rules, report, consumed, scan_chars)
+    line_ends = []
+    head, spent, fits = _take_lines(lines, token_budget, seen, line_ends)
+    if fits and consumed[0] >= size:
+        return _join_units(head)
+    head_end = consumed[0]
+
+    # The head was taken with the whole budget to see whether the document fits; keep its share.
+    # The two gap markers are paid for up front.
+    token_budget -= 2 * _word_tokens(GAP_MARKER)
+    head_budget = int(token_budget * HEAD_SHARE)
+    kept = 0
+    spent = 0
+    while kept < len(head) and spent + head[kept][2] <= head_budget:
+        spent += head[kept][2]
+        kept += 1
+    sections = [head[:kept]]
+    # Lines trimmed off the head aren't sent, so the middle and tail may still use them
+    seen = set(key for key, end in line_ends if end <= kept)
+    # The middle and tail don't start the document, so rules for its header don't apply there
+    rules = [rule for rule in rules if rule not in HEADER_RULES]
+
+    middle_start = max(size // 2, head_end)
+    consumed = [0]
+    lines = _section_lines(read, size, chunk_chars, middle_start, middle_start > head_end, rules, report, consumed,
+                           scan_chars)
+    middle, middle_spent, _ = _take_lines(lines, int(token_budget * MIDDLE_SHARE), seen)
+    sections.append(middle)
+    spent += middle_spent
+
+    middle_end = middle_start + consumed[0]
+    tail_start = max(middle_end, size - scan_chars)
+    lines = list(_section_lines(read, size, chunk_chars, tail_start, tail_start > middle_end, rules, report, [0],
+                                scan_chars))
+    sections.append(_take_last_lines(lines, token_budget - spent, seen)[0])
+    return (" " + GAP_MARKER + " ").join(_join_units(section) for section in sections if section)
+
+
+# Lines starting like a comment in common languages; in prose "#" opens a heading and "*" a bullet
+_COMMENT_LINE_RE = re.compile(r"\s*(?:#|//|/\*|\*|--|;|<!--|%|\"\"\"|''')")
+_PROSE_COMMENT_LINE_RE = re.compile(r"\s*(?://|/\*|--|;|<!--|%|\"\"\"|''')")
+# Syntaxes whose text is prose; None is plain text (see CompactionReport)
+PROSE_SYNTAXES = frozenset([None, "Markdown", "MultiMarkdown", "Markdown GFM"])
+# A notice, not just the word: "Copyright (c) <year or holder>", "(c) 2024", "\u00a9 Example Corp",
+# an SPDX identifier or "licensed under"
+_LICENSE_RE = re.compile(
+    r"(?:[Cc]opyright|COPYRIGHT)\s*(?:\([Cc]\)|\u00a9)\s*(?:\d{4}|[A-Z])"
+    r"|(?:[Cc]opyright|COPYRIGHT|\([Cc]\)|\u00a9)\s*\d{4}"
+    r"|\u00a9\s*[A-Z]"
+    r"|SPDX-License-Identifier:"
+    r"|[Ll]icen[cs]ed under"
+)
+# License headers longer than this are rare; longer comment blocks are kept unread
+MAX_LICENSE_LINES = 60
+
+# Timestamps opening a log line: ISO 8601, syslog ("Jan  5 14:03:01") or a bare time of day
+_LOG_TIMESTAMP_RE = re.compile(
+    r"\s*\[?(?:\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:[.,]\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?"
+    r"|[A-Z][a-z]{2} +\d{1,2} \d{2}:\d{2}:\d{2}"
+    r"|\d{2}:\d{2}:\d{2}(?:[.,]\d+)?)\]?\s*"
+)
+# Level and source that follow the timestamp: "ERROR [worker-3] ", "sshd[812]: "
+_LOG_SOURCE_RE = re.compile(
+    r"(?:(?:TRACE|DEBUG|INFO|NOTICE|WARN(?:ING)?|ERROR|FATAL|CRITICAL)\b:?\s*)?"
+    r"(?:\[[^\]\n]{1,64}\]:?\s*|[\w.-]{1,64}(?:\[\d+\])?:\s+)?"
+)
+_WHITESPACE_TOKEN_RE = re.compile(r"\s{2,}|[^\S ]")
+
+
+def estimate_text_tokens(text):
+    """estimate_tokens plus the whitespace a tokenizer would charge: indentation, runs and line breaks"""
+    return estimate_tokens(text) + len(_WHITESPACE_TOKEN_RE.findall(text))
+
+
+class CompactionReport:
+    """
+    Estimated tokens each compaction rule removed from the text it saw
+
+    syntax: Name of the document's syntax (e.g. "Python") for rules that depend on it,
+    or None for plain text
+    """
+
+    def __init__(self, syntax=None):
+        self.syntax = syntax
+        self.saved = {}
+
+    def record(self, rule, tokens):
+        if tokens > 0:
+            self.saved[rule] = self.saved.get(rule, 0) + tokens
+
+    @property
+    def tokens_saved(self):
+        return sum(self.saved.values())
+
+
+def drop_license_headers(lines, report):
+    """
+    Drop the comment blocks (runs of comment lines) opening the document that hold a
+    copyright or license notice; the header ends at the first other block or line of
+    text, and nothing after it is dropped
+    """
+    comment_re = _PROSE_COMMENT_LINE_RE if report.syntax in PROSE_SYNTAXES else _COMMENT_LINE_RE
+
+    def notice(block):
+        if any(_LICENSE_RE.search(text) for text in block):
+            report.record("drop_license_headers", sum(estimate_text_tokens(text) for text in block))
+            return True
+        return False
+
+    lines = iter(lines)
+    block = []
+    for line in lines:
+        if comment_re.match(line):
+            block.append(line)
+            if len(block) < MAX_LICENSE_LINES:
+                continue
+            line = ""
+        dropped = notice(block)
+        if not dropped:
+            for kept in block:
+                yield kept
+        header_over = bool(block) and not dropped or bool(line.strip())
+        block = []
+        if line:
+            yield line
+        if header_over:
+            break
+    # Lines left here are either after the header or a document that is all comments
+    if not notice(block):
+        for line in block:
+            yield line
+    for line in lines:
+        yield line
+
+
+def dedupe_log_prefixes(lines, report):
+    """
+    Keep the first log timestamp only, and drop a line's level and source
+    ("INFO [worker-3]") when they repeat the previous line's
+
+    Only runs of at least two consecutive log-shaped lines are rewritten, so a lone
+    "09:15:00 Bob: review" in notes keeps its time.
+    """
+    first = True
+    previous = None
+    pending = None  # a log line and its timestamp match, not yet known to start a run
+    for line in lines:
+        match = _LOG_TIMESTAMP_RE.match(line)
+        if not match:
+            if pending is not None:
+                yield pending[0]
+                pending = None
+            previous = None
+            yield line
+            continue
+        if previous is None and pending is None:
+            pending = (line, match)
+            continue
+        run = [pending, (line, match)] if pending is not None else [(line, match)]
+        pending = None
+        for line, match in run:
+            body = line[match.end():]
+            source = _LOG_SOURCE_RE.match(body)
+            prefix = source.group().strip()
+            removed = "" if first else line[:match.end()]
+            if prefix and prefix == previous:
+                removed += body[:source.end()]
+                body = body[source.end():]
+            previous = prefix
+            if first:
+                body = line[:match.end()] + body
+                first = False
+            report.record("dedupe_log_prefixes", estimate_text_tokens(removed))
+            yield body
+    if pending is not None:
+        yield pending[0]
+
+
+def collapse_whitespace(lines, report):
+    """Reduce each line to its words separated by single spaces; blank lines are dropped"""
+    for line in lines:
+        report.record("collapse_whitespace", len(_WHITESPACE_TOKEN_RE.findall(line)))
+        compact = " ".join(line.split())
+        if compact:
+            yield compact
+
+
+# Compaction rules by name; the excerpt_compaction setting picks which run, in its order.
+# A rule takes an iterable of lines and a CompactionReport and yields the lines to keep,
+# possibly rewritten, recording the estimated tokens it removed.
+COMPACTION_RULES = {
+    "drop_license_headers": drop_license_headers,
+    "dedupe_log_prefixes": dedupe_log_prefixes,
+    "collapse_whitespace": collapse_whitespace,
+}
+
+# Rules that only look at the start of the document; sample_tokens runs them on the head alone
+HEADER_RULES = set([drop_license_headers])
+
+
+def register_compaction_rule(name, rule, header=False):
+    """
+    Make rule selectable by name in the excerpt_compaction setting
+
+    header: The rule only handles the start of the document (like drop_license_headers),
+    so it isn't run on sampled sections from further in
+    """
+    COMPACTION_RULES[name] = rule
+    if header:
+        HEADER_RULES.add(rule)
+
+
+def compact_lines(lines, rules, report=None):
+    """Chain rules over lines lazily; report defaults to a throwaway CompactionReport"""
+    report = report if report is not None else CompactionReport()
+    for rule in rules:
+        lines = rule(lines, report)
+    return lines
@@ -0,0 +1,515 @@
+# ABOUTME: Caches generated filenames by content so re-saving known text skips the LLM call
+# ABOUTME: Exact matches via an in-memory LRU and SQLite store; near-duplicates via a banded SimHash index
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    from . import ai_client
+except ImportError:
+    import ai_client
+
+# Some embedded Python builds ship without sqlite3; the persistent cache is then unavailable
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+
+def cache_key(model, prompt_template, excerpt):
+    """
+    Hex digest identifying a naming request.
+
+    The three parts are NUL-separated so ("ab", "c") and ("a", "bc") can't collide.
+    SHA-1 runs in C at well over 1 GB/s, so hashing a 250-word excerpt costs microseconds.
+    """
+    data = "\0".join((model or "", prompt_template or "", excerpt)).encode("utf-8", "surrogatepass")
+    return hashlib.sha1(data).hexdigest()
+
+
+def similarity_scope(model, prompt_template):
+    """Near-duplicate matches only count for the same model and prompt template"""
+    return cache_key(model, prompt_template, "")[:16]
+
+
+SIMHASH_BITS = 64
+
+# Below this many distinct words a changed word moves the fingerprint too far to be meaningful
+SIMHASH_MIN_FEATURES = 8
+
+_FEATURE_RE = re.compile(r"\w+", re.UNICODE)
+
+
+# SimHash keeps one counter per fingerprint bit. They are packed _COUNTER_BITS apart into
+# a single int so each word adds its weight to all 64 at once; _SPREAD[k][b] spreads the
+# bits of byte b at digest position k into their counters.
+_COUNTER_BITS = 32
+_COUNTER_MASK = (1 << _COUNTER_BITS) - 1
+_SPREAD = [
+    [sum(1 << (_COUNTER_BITS * (8 * k + i)) for i in range(8) if byte >> i & 1) for byte in range(256)]
+    for k in range(SIMHASH_BITS // 8)
+]
+
+
+def simhash(text):
+    """
+    64-bit SimHash of the non-numeric words in text (case-insensitive, weighted by
+    count), or None when text has fewer than SIMHASH_MIN_FEATURES distinct words.
+
+    Texts sharing most of their words get fingerprints a small Hamming distance apart.
+    Word hashes come from MD5 rather than hash() so fingerprints are stable across
+    processes and can be stored.
+    """
+    counts = {}
+    for word in _FEATURE_RE.findall(text.lower()):
+        # Dates, counts and version numbers are what usually differs between copies of a template
+        if not word.isdigit():
+            counts[word] = counts.get(word, 0) + 1
+    if len(counts) < SIMHASH_MIN_FEATURES:
+        return None
+
+    s0, s1, s2, s3, s4, s5, s6, s7 = _SPREAD
+    packed = 0
+    for word, count in counts.items():
+        d = hashlib.md5(word.encode("utf-8", "surrogatepass")).digest()
+        packed += count * (s0[d[0]] | s1[d[1]] | s2[d[2]] | s3[d[3]] | s4[d[4]] | s5[d[5]] | s6[d[6]] | s7[d[7]])
+
+    # A bit is set when words with that bit outweigh those without it
+    half = sum(counts.values()) / 2.0
+    fingerprint = 0
+    for bit in range(SIMHASH_BITS):
+        if (packed >> (_COUNTER_BITS * bit)) & _COUNTER_MASK > half:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+# int.bit_count() (Python 3.10+) is several times faster than counting "1"s in bin()
+_popcount = getattr(int, "bit_count", None) or (lambda value: bin(value).count("1"))
+
+
+def hamming_distance(a, b):
+    return _popcount(a ^ b)
+
+
+def _bands(max_distance):
+    """(shift, mask) per band: max_distance + 1 bands, so a match within max_distance agrees on one"""
+    count = max_distance + 1
+    bands = []
+    shift = 0
+    for i in range(count):
+        width = SIMHASH_BITS // count + (1 if i < SIMHASH_BITS % count else 0)
+        bands.append((shift, (1 << width) - 1))
+        shift += width
+    return bands
+
+
+class SimilarityIndex:
+    """
+    Thread-safe near-duplicate lookup of fingerprints -> filename.
+
+    Each fingerprint is split into max_distance + 1 bands and indexed by every band
+    value. Two fingerprints within max_distance bits must agree exactly on at least one
+    band (pigeonhole), so nearest() only compares against fingerprints sharing a band;
+    with the default 9-bit bands that is a few hundred candidates at 50000 entries.
+    Entries are scoped (see similarity_scope()), LRU-evicted past max_entries and
+    ignored after ttl seconds.
+    """
+
+    def __init__(self, max_distance=6, max_entries=10000, ttl=2592000.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (scope, fingerprint) -> (filename, stored_at)
+        self._buckets = {}             # (scope, band index, band value) -> set of fingerprints
+        self.max_distance = max_distance
+        self._band_masks = _bands(max_distance)
+
+    def set_max_distance(self, max_distance):
+        """Change the match radius, re-banding existing entries"""
+        with self._lock:
+            if max_distance == self.max_distance:
+                return
+            self.max_distance = max_distance
+            self._band_masks = _bands(max_distance)
+            self._buckets = {}
+            for scope, fingerprint in self._entries:
+                self._link(scope, fingerprint)
+
+    def add(self, scope, fingerprint, filename, stored_at=None):
+        with self._lock:
+            if self.max_entries <= 0:
+                return
+            key = (scope, fingerprint)
+            if key not in self._entries:
+                self._link(scope, fingerprint)
+            self._entries[key] = (filename, time.time() if stored_at is None else stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                (old_scope, old_fingerprint), _ = self._entries.popitem(last=False)
+                self._unlink(old_scope, old_fingerprint)
+
+    def nearest(self, scope, fingerprint):
+        """Return (filename, distance) of the closest entry within max_distance, or None"""
+        best = None
+        with self._lock:
+            candidates = set()
+            for i, (shift, mask) in enumerate(self._band_masks):
+                candidates.update(self._buckets.get((scope, i, (fingerprint >> shift) & mask), ()))
+            expired_before = time.time() - self.ttl
+            for candidate in candidates:
+                distance = _popcount(fingerprint ^ candidate)
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    filename, stored_at = self._entries[(scope, candidate)]
+                    if stored_at >= expired_before:
+                        best = (filename, distance, candidate)
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end((scope, best[2]))
+        ai_client.metrics.increment("filename_cache.similar.hit" if best else "filename_cache.similar.miss")
+        return best[:2] if best else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _link(self, scope, fingerprint):
+        for i, (shift, mask) in enumerate(self._band_masks):
+            self._buckets.setdefault((scope, i, (fingerprint >> shift) & mask), set()).add(fingerprint)
+
+    def _unlink(self, scope, fingerprint):
+        for i, (shift, mask) in enumerate(self._band_masks):
+            key = (scope, i, (fingerprint >> shift) & mask)
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(fingerprint)
+                if not bucket:
+                    del self._buckets[key]
+
+
+class FilenameCache:
+    """
+    Thread-safe LRU map of cache_key() -> filename.
+
+    Holds at most max_entries names (least recently used evicted first); entries
+    older than ttl seconds are treated as misses. max_entries=0 disables caching.
+    hits and misses count lookups since creation.
+    """
+
+    def __init__(self, max_entries=256, ttl=86400.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (filename, stored_at)
+
+    def get(self, key):
+        """Return the cached filename for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        ai_client.metrics.increment("filename_cache.memory.hit" if entry else "filename_cache.memory.miss")
+        return entry[0] if entry else None
+
+    def put(self, key, filename):
+        with self._lock:
+            if self.max_entries <= 0:
+                return
+            self._entries[key] = (filename, time.monotonic())
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def resize(self, max_entries):
+        with self._lock:
+            self.max_entries = max_entries
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self):
+        while len(self._entries) > max(self.max_entries, 0):
+            self._entries.popitem(last=False)
+
+
+class DiskFilenameCache:
+    """
+    SQLite-backed cache_key() -> filename map that survives restarts.
+
+    The database runs in WAL mode so several plugin host processes can read and write
+    it at once. Entries expire ttl seconds after they were stored; past max_entries
+    the least recently used are deleted. Lookups are a primary-key read (tens of
+    microseconds); the last-used time is only rewritten once per touch_interval
+    seconds so hits rarely write. Database errors are logged and count as misses.
+    """
+
+    touch_interval = 60.0
+
+    def __init__(self, path, max_entries=10000, ttl=2592000.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit; the connection is shared by threads under _lock
+        self._db = sqlite3.connect(path, timeout=0.5, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL with synchronous=NORMAL doesn't fsync per commit; a crash can only lose recent names
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS names ("
+            "key TEXT PRIMARY KEY, filename TEXT NOT NULL, created REAL NOT NULL, used REAL NOT NULL, "
+            "scope TEXT, simhash INTEGER"
+            ")"
+        )
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(names)")]
+        if "simhash" not in columns:
+            # Databases created before near-duplicate matching
+            self._db.execute("ALTER TABLE names ADD COLUMN scope TEXT")
+            self._db.execute("ALTER TABLE names ADD COLUMN simhash INTEGER")
+        self._db.execute("CREATE INDEX IF NOT EXISTS names_used ON names (used)")
+
+    def get(self, key):
+        """Return the cached filename for key, or None"""
+        start = time.perf_counter()
+        now = time.time()
+        filename = None
+        try:
+            with self._lock:
+                row = self._db.execute("SELECT filename, created, used FROM names WHERE key = ?", (key,)).fetchone()
+                if row is not None and now - row[1] > self.ttl:
+                    self._db.execute("DELETE FROM names WHERE key = ?", (key,))
+                elif row is not None:
+                    filename = row[0]
+                    if now - row[2] > self.touch_interval:
+                        self._db.execute("UPDATE names SET used = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            print("AutoSaveWithAI: Filename cache lookup failed: {}".format(e))
+        with self._lock:
+            if filename is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        ai_client.metrics.increment("filename_cache.disk.hit" if filename else "filename_cache.disk.miss")
+        ai_client.metrics.observe("filename_cache.disk.lookup_seconds", time.perf_counter() - start)
+        return filename
+
+    def put(self, key, filename, scope=None, fingerprint=None):
+        """Store filename under key, with its similarity scope and SimHash if it has one"""
+        now = time.time()
+        if fingerprint is not None and fingerprint >= 1 << 63:
+            # SQLite integers are signed 64-bit
+            fingerprint -= 1 << 64
+        try:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, filename, now, now, scope, fingerprint)
+                )
+                self._db.execute("DELETE FROM names WHERE created < ?", (now - self.ttl,))
+                excess = self._db.execute("SELECT COUNT(*) FROM names").fetchone()[0] - max(self.max_entries, 0)
+                if excess > 0:
+                    self._db.execute(
+                        "DELETE FROM names WHERE key IN (SELECT key FROM names ORDER BY used LIMIT ?)", (excess,)
+                    )
+        except sqlite3.Error as e:
+            print("AutoSaveWithAI: Could not store filename in cache: {}".format(e))
+
+    def fingerprints(self, limit):
+        """Return up to limit unexpired (scope, simhash, filename, created) rows, least recently used first"""
+        try:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT scope, simhash, filename, created FROM ("
+                    "SELECT scope, simhash, filename, created, used FROM names "
+                    "WHERE simhash IS NOT NULL AND created >= ? ORDER BY used DESC LIMIT ?"
+                    ") ORDER BY used",
+                    (time.time() - self.ttl, max(limit, 0))
+                ).fetchall()
+        except sqlite3.Error as e:
+            print("AutoSaveWithAI: Could not read filename cache fingerprints: {}".format(e))
+            return []
+        return [(scope, simhash % (1 << 64), filename, created) for scope, simhash, filename, created in rows]
+
+    def clear(self):
+        try:
+            with self._lock:
+                self._db.execute("DELETE FROM names")
+        except sqlite3.Error as e:
+            print("AutoSaveWithAI: Could not clear filename cache: {}".format(e))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __len__(self):
+        try:
+            with self._lock:
+                return self._db.execute("SELECT COUNT(*) FROM names").fetchone()[0]
+        except sqlite3.Error as e:
+            print("AutoSaveWithAI: Could not count filename cache entries: {}".format(e))
+            return 0
+
+
+_memory_cache = FilenameCache()
+_disk_cache = None
+# None while near-duplicate matching is off
+_similar_index = None
+
+
+def configure(max_entries=None, ttl=None):
+    """Set the in-memory cache size (0 disables it) and entry lifetime in seconds"""
+    if max_entries is not None and max_entries != _memory_cache.max_entries:
+        _memory_cache.resize(max_entries)
+    if ttl is not None:
+        _memory_cache.ttl = ttl
+
+
+def configure_similarity(max_distance=6, max_entries=10000, ttl=2592000.0):
+    """
+    Reuse names of near-duplicate texts: SimHash fingerprints up to max_distance bits
+    apart (of 64) match. max_distance=None turns matching off.
+    """
+    global _similar_index
+    if max_distance is None:
+        _similar_index = None
+        return
+    if not 0 <= max_distance < SIMHASH_BITS // 2:
+        raise ValueError("max_distance must be between 0 and {}".format(SIMHASH_BITS // 2 - 1))
+    if _similar_index is None:
+        _similar_index = SimilarityIndex(max_distance, max_entries, ttl)
+        if _disk_cache is not None:
+            _load_fingerprints()
+        return
+    _similar_index.set_max_distance(max_distance)
+    _similar_index.max_entries = max_entries
+    _similar_index.ttl = ttl
+
+
+def _load_fingerprints():
+    """Fill the similarity index from the persistent cache"""
+    for scope, fingerprint, filename, created in _disk_cache.fingerprints(_similar_index.max_entries):
+        _similar_index.add(scope, fingerprint, filename, stored_at=created)
+
+
+def configure_disk(path, max_entries=10000, ttl=2592000.0):
+    """
+    Back the memory cache with a SQLite database at path (None or "" turns it off).
+    Reopens only when path changes, so this is cheap to call on every save.
+
+    Returns:
+        False if the database could not be opened, otherwise True
+    """
+    global _disk_cache
+    if _disk_cache is not None and _disk_cache.path == path:
+        _disk_cache.max_entries = max_entries
+        _disk_cache.ttl = ttl
+        return True
+    close()
+    if not path:
+        return True
+    if sqlite3 is None:
+        print("AutoSaveWithAI: sqlite3 is not available, persistent filename cache disabled")
+        return False
+    try:
+        _disk_cache = DiskFilenameCache(path, max_entries, ttl)
+    except (sqlite3.Error, OSError) as e:
+        print("AutoSaveWithAI: Could not open filename cache {}: {}".format(path, e))
+        return False
+    if _similar_index is not None:
+        _load_fingerprints()
+    return True
+
+
+def lookup(model, prompt_template, excerpt):
+    """
+    Return a previously generated filename for this request, or None.
+    Exact matches (memory, then disk) come first, then near-duplicate texts.
+    """
+    key = cache_key(model, prompt_template, excerpt)
+    filename = _memory_cache.get(key)
+    if filename is None and _disk_cache is not None:
+        filename = _disk_cache.get(key)
+        if filename is not None:
+            _memory_cache.put(key, filename)
+    similar_index = _similar_index
+    if filename is None and similar_index is not None:
+        fingerprint = simhash(excerpt)
+        match = similar_index.nearest(similarity_scope(model, prompt_template), fingerprint) if fingerprint else None
+        if match is not None:
+            filename = match[0]
+            print("AutoSaveWithAI: Reusing name of a near-duplicate text ({} bits apart)".format(match[1]))
+            _memory_cache.put(key, filename)
+    return filename
+
+
+def store(model, prompt_template, excerpt, filename):
+    """Remember filename as the answer for this request"""
+    key = cache_key(model, prompt_template, excerpt)
+    _memory_cache.put(key, filename)
+    scope = fingerprint = None
+    similar_index = _similar_index
+    if similar_index is not None:
+        fingerprint = simhash(excerpt)
+        if fingerprint is not None:
+            scope = similarity_scope(model, prompt_template)
+            similar_index.add(scope, fingerprint, filename)
+    if _disk_cache is not None:
+        _disk_cache.put(key, filename, scope, fingerprint)
+
+
+def stats():
+    """
+    Return {"hits", "misses", "entries"} for the in-memory cache, plus "disk_*" and
+    "similar_*" counterparts when the persistent cache and near-duplicate matching are on
+    """
+    result = {"hits": _memory_cache.hits, "misses": _memory_cache.misses, "entries": len(_memory_cache)}
+    if _disk_cache is not None:
+        result.update(disk_hits=_disk_cache.hits, disk_misses=_disk_cache.misses, disk_entries=len(_disk_cache))
+    if _similar_index is not None:
+        result.update(similar_hits=_similar_index.hits, similar_misses=_similar_index.misses,
+                      similar_entries=len(_similar_index))
+    return result
+
+
+def clear():
+    _memory_cache.clear()
+    if _disk_cache is not None:
+        _disk_cache.clear()
+    if _similar_index is not None:
+        _similar_index.clear()
+
+
+def close():
+    """Close the persistent cache, e.g. when the plugin unloads"""
+    global _disk_cache
+    if _disk_cache is not None:
+        _disk_cache.close()
+        _disk_cache = None
@@ -0,0 +1,397 @@
+# ABOUTME: Stdlib stand-in for an OpenAI-compatible API (/chat/completions and /responses, incl. streaming)
+# ABOUTME: Configurable latency, injected faults and deterministic filenames; runs in-process or as a subprocess
+
+import argparse
+import gzip
+import json
+import random
+import re
+import socket
+import ssl
+import struct
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+# Fault kinds that can be injected into a response
+FAULTS = ("429", "500", "503", "reset", "slowloris")
+
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+
+
+def fake_filename(prompt):
+    """
+    Deterministic "LLM answer" for a prompt: the first three words of the text after
+    the last "Text:" marker (or of the whole prompt), plus an extension guessed
+    from the content.
+    """
+    _, marker, text = prompt.rpartition("Text:")
+    if not marker:
+        text = prompt
+    stripped = text.strip()
+    if stripped.startswith(("{", "[")):
+        extension = "json"
+    elif stripped.startswith("#"):
+        extension = "md"
+    elif re.search(r"^\s*(def|class|import|from)\s", stripped, re.MULTILINE):
+        extension = "py"
+    else:
+        extension = "txt"
+    words = [word.lower() for word in _WORD_RE.findall(stripped)[:3]]
+    return "{}.{}".format("-".join(words) or "untitled", extension)
+
+
+def parse_latency(spec):
+    """
+    Turn a latency spec into a function of a random.Random returning seconds.
+
+    Specs: None or "0" (no delay), "fixed:S", "uniform:LOW:HIGH", "normal:MEAN:SD",
+    "lognormal:MEDIAN:SIGMA" (heavy tail, like real APIs), or a callable taking the rng.
+    """
+    if spec is None:
+        return lambda rng: 0.0
+    if callable(spec):
+        return spec
+    parts = str(spec).split(":")
+    kind, args = parts[0], [float(arg) for arg in parts[1:]]
+    if kind in ("0", "none"):
+        return lambda rng: 0.0
+    if kind == "fixed":
+        return lambda rng: args[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(args[0], args[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(args[0], args[1]))
+    if kind == "lognormal":
+        median, sigma = args
+        return lambda rng: rng.lognormvariate(0.0, sigma) * median
+    raise ValueError("Unknown latency spec: {}".format(spec))
+
+
+def _prompt_text(path, body):
+    """The user text of a chat or responses request"""
+    if path.endswith("/responses"):
+        value = body.get("input", "")
+        if isinstance(value, str):
+            return value
+        messages = value
+    else:
+        messages = body.get("messages") or []
+    return _messages_text(messages)
+
+
+def _messages_text(messages):
+    """The text of a list of chat or responses messages, one message per line"""
+    parts = []
+    for message in messages:
+        content = message.get("content", "") if isinstance(message, dict) else ""
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        parts.append(content)
+    return "\n".join(parts)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # Clients abandoning slow or faulty responses is expected here
+        if not isinstance(sys.exc_info()[1], (ConnectionError, socket.timeout, ssl.SSLError)):
+            super().handle_error(request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        fake = self.server.fake
+        raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding") == "gzip":
+            raw = gzip.decompress(raw)
+        try:
+            body = json.loads(raw.decode("utf-8"))
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid JSON body"}})
+            return
+
+        path = self.path.split("?", 1)[0]
+        if not path.endswith(("/chat/completions", "/responses")):
+            self._send_json(404, {"error": {"message": "unknown path {}".format(path)}})
+            return
+
+        fault, delay = fake._next_outcome()
+        fake._record(path, body, self.headers, fault)
+        if delay:
+            time.sleep(delay)
+
+        if fault == "reset":
+            # RST instead of FIN: the client sees ECONNRESET mid-request
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            self.close_connection = True
+            return
+        if fault in ("429", "500", "503"):
+            headers = {"Retry-After": fake.retry_after} if fault == "429" else {}
+            self._send_json(int(fault), {"error": {"message": "injected {}".format(fault)}}, headers)
+            return
+
+        name = fake.filename_for(_prompt_text(path, body))
+        if body.get("stream"):
+            self._stream(path, name)
+        elif fault == "slowloris":
+            self._send_json(200, self._payload(path, name, body), trickle=True)
+        else:
+            self._send_json(200, self._payload(path, name, body))
+
+    def do_GET(self):
+        # Health probes (ai_client.probe_endpoint) hit {api_base}/models
+        self._send_json(200, {"object": "list", "data": [{"id": "fake-model", "object": "model"}]})
+
+    def _payload(self, path, name, body):
+        fake = self.server.fake
+        text = name + fake.chatter
+        usage_in = len(_prompt_text(path, body)) // 4
+        cached = min(fake._cached_tokens(path, body), usage_in)
+        if path.endswith("/responses"):
+            return {
+                "object": "response",
+                "model": body.get("model"),
+                "output_text": text,
+                "output": [{"type": "message", "role": "assistant",
+                            "content": [{"type": "output_text", "text": text}]}],
+                "usage": {"input_tokens": usage_in, "output_tokens": len(text) // 4,
+                          "input_tokens_details": {"cached_tokens": cached}},
+            }
+        return {
+            "object": "chat.completion",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": usage_in, "completion_tokens": len(text) // 4,
+                      "prompt_tokens_details": {"cached_tokens": cached}},
+        }
+
+    def _send_json(self, status, payload, headers=None, trickle=False):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if not trickle:
+            self.wfile.write(data)
+            return
+        # Slowloris: the body arrives a byte at a time
+        for i in range(len(data)):
+            self.wfile.write(data[i:i + 1])
+            self.wfile.flush()
+            time.sleep(self.server.fake.slowloris_interval)
+
+    def _stream(self, path, name):
+        fake = self.server.fake
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        text = name + fake.chatter
+        pieces = [text[i:i + 4] for i in range(0, len(text), 4)]
+        events = []
+        if path.endswith("/responses"):
+            for piece in pieces:
+                events.append(("response.output_text.delta",
+                               {"type": "response.output_text.delta", "delta": piece}))
+            events.append(("response.completed", {"type": "response.completed"}))
+        else:
+            for piece in pieces:
+                events.append((None, {"choices": [{"index": 0, "delta": {"content": piece}}]}))
+            events.append((None, "[DONE]"))
+
+        for event_type, data in events:
+            frame = "data: {}\n\n".format(data if isinstance(data, str) else json.dumps(data))
+            if event_type:
+                frame = "event: {}\n".format(event_type) + frame
+            chunk = frame.encode("utf-8")
+            self.wfile.write("{:x}\r\n".format(len(chunk)).encode("ascii") + chunk + b"\r\n")
+            self.wfile.flush()
+            if fake.stream_interval:
+                time.sleep(fake.stream_interval)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeOpenAIServer:
+    """
+    In-process OpenAI-compatible server on a background thread.
+
+    Args:
+        latency: Latency spec (see parse_latency) applied before each response
+        faults: Dict fault kind -> probability, e.g. {"429": 0.05, "reset": 0.01}
+        fault_sequence: Faults (or None for a normal reply) used for the first requests,
+            in order, before the probabilities apply
+        seed: Seed for latency and fault draws, so runs are reproducible
+        certfile: PEM with certificate and key to serve HTTPS
+        chatter: Text appended after the filename, like a model that explains itself
+        stream_interval: Seconds between streamed events
+        slowloris_interval: Seconds between body bytes for the "slowloris" fault
+        retry_after: Retry-After header value sent with injected 429s
+
+    Use as a context manager, or call start() and stop(). base_url is e.g.
+    "http://127.0.0.1:PORT/v1"; requests and outcomes are recorded in .requests.
+    Repeated prompt prefixes are reported as cached tokens in usage, like provider prompt caches.
+    """
+
+    def __init__(self, latency=None, faults=None, fault_sequence=None, seed=0, certfile=None,
+                 chatter="", stream_interval=0.0, slowloris_interval=0.2, retry_after="0",
+                 host="127.0.0.1", port=0):
+        for kind in list(faults or {}) + [f for f in fault_sequence or [] if f]:
+            if kind not in FAULTS:
+                raise ValueError("Unknown fault {!r}; expected one of {}".format(kind, FAULTS))
+        self.latency = parse_latency(latency)
+        self.faults = dict(faults or {})
+        self.fault_sequence = list(fault_sequence or [])
+        self.chatter = chatter
+        self.stream_interval = stream_interval
+        self.slowloris_interval = slowloris_interval
+        self.retry_after = retry_after
+        self.requests = []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._names = {}
+        self._prefixes = set()
+
+        self._server = _Server((host, port), _Handler)
+        self._server.fake = self
+        scheme = "http"
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile)
+            self._server.socket = context.wrap_socket(self._server.socket, server_side=True)
+            scheme = "https"
+        self.base_url = "{}://{}:{}/v1".format(scheme, host, self._server.server_address[1])
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def filename_for(self, prompt):
+        """Same prompt, same name (memoized so lookups stay cheap under load)"""
+        name = self._names.get(prompt)
+        if name is None:
+            name = self._names[prompt] = fake_filename(prompt)
+        return name
+
+    def outcomes(self):
+        """Count of recorded requests per outcome ("ok" or a fault kind)"""
+        counts = {}
+        with self._lock:
+            for request in self.requests:
+                counts[request["outcome"]] = counts.get(request["outcome"], 0) + 1
+        return counts
+
+    def _cached_tokens(self, path, body):
+        """
+        Simulated prompt caching: every message before the last one is the prefix; a
+        prefix seen before (under the same prompt_cache_key) counts as cached tokens,
+        measured on its text like the input tokens
+        """
+        messages = body.get("input") if path.endswith("/responses") else body.get("messages")
+        if not isinstance(messages, list) or len(messages) < 2:
+            return 0
+        prefix = json.dumps([body.get("prompt_cache_key"), messages[:-1]], sort_keys=True)
+        with self._lock:
+            seen = prefix in self._prefixes
+            self._prefixes.add(prefix)
+        return len(_messages_text(messages[:-1])) // 4 if seen else 0
+
+    def _next_outcome(self):
+        with self._lock:
+            delay = self.latency(self._rng)
+            if self.fault_sequence:
+                return self.fault_sequence.pop(0), delay
+            draw = self._rng.random()
+            for kind in FAULTS:
+                probability = self.faults.get(kind, 0.0)
+                if draw < probability:
+                    return kind, delay
+                draw -= probability
+            return None, delay
+
+    def _record(self, path, body, headers, fault):
+        with self._lock:
+            self.requests.append({"path": path, "body": body, "headers": dict(headers),
+                                  "outcome": fault or "ok"})
+
+
+def start_subprocess(*args):
+    """
+    Run this module as a separate process (so it doesn't share the client's GIL).
+
+    Args:
+        args: Command-line arguments, e.g. "--latency", "lognormal:0.05:0.5"
+
+    Returns:
+        Tuple (subprocess.Popen, base_url); terminate() the process when done
+    """
+    process = subprocess.Popen(
+        [sys.executable, __file__] + list(args),
+        stdout=subprocess.PIPE, universal_newlines=True
+    )
+    line = process.stdout.readline().strip()
+    if not line.startswith(("http://", "https://")):
+        process.kill()
+        raise RuntimeError("Fake server failed to start: {!r}".format(line))
+    return process, line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency", default=None, help="e.g. fixed:0.05, uniform:0.01:0.2, lognormal:0.08:0.6")
+    parser.add_argument("--fault", action="append", default=[], metavar="KIND=PROBABILITY",
+                        help="inject a fault: {}".format(", ".join(FAULTS)))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--certfile", default=None, help="PEM with certificate and key, to serve HTTPS")
+    parser.add_argument("--chatter", default="", help="text appended after the filename")
+    parser.add_argument("--stream-interval", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    faults = {}
+    for fault in args.fault:
+        kind, _, probability = fault.partition("=")
+        faults[kind] = float(probability)
+
+    server = FakeOpenAIServer(latency=args.latency, faults=faults, seed=args.seed, certfile=args.certfile,
+                              chatter=args.chatter, stream_interval=args.stream_interval,
+                              host=args.host, port=args.port)
+    print(server.base_url, flush=True)
+    try:
+        server._server.serve_forever(0.05)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
-# ABOUTME: Integration tests for AutoSaveWithAI plugin requiring real API access
-# ABOUTME: Tests actual API calls and end-to-end filename generation with OpenAI-compatible endpoints
+# ABOUTME: End-to-end filename generation tests against an OpenAI-compatible endpoint
+# ABOUTME: Uses the real API when TEST_API_KEY is set, otherwise the local fake server (hermetic)
 
 import unittest
 import sys
 import os
+import time
 from unittest.mock import MagicMock
 
 # Add parent directory to path to import the plugin
@@ -14,10 +15,40 @@ sys.modules['sublime'] = MagicMock()
 sys.modules['sublime_plugin'] = MagicMock()
 
 from AutoSaveWithAI import AIClient, extract_first_words, AI_CLIENT_AVAILABLE
+from tests.fake_openai_server import FakeOpenAIServer, fake_filename, start_subprocess
+
+if AI_CLIENT_AVAILABLE:
+    import ai_client
+
+PROMPT = ("Based on the following text, suggest a short, descriptive filename. "
+          "Include an appropriate file extension (.txt, .md, .json, .py, etc.) "
+          "based on the content type. Respond with ONLY the filename, nothing else.\n\n"
+          "Text: {content}")
+
+# Stand-in for the real API while no TEST_API_KEY is configured
+_fake_server = None
+
+
+def setUpModule():
+    global _fake_server
+    if not os.environ.get('TEST_API_KEY'):
+        _fake_server = FakeOpenAIServer(latency="uniform:0.001:0.01").start()
+
+
+def tearDownModule():
+    if _fake_server is not None:
+        _fake_server.stop()
 
 
 def get_test_config():
-    """Get test configuration from environment variables or use defaults"""
+    """Get test configuration from environment variables, or point at the fake server"""
+    if _fake_server is not None:
+        return {
+            'model': 'fake-model',
+            'api_key': 'fake-key',
+            'api_base': _fake_server.base_url,
+            'api_type': os.environ.get('TEST_API_TYPE', 'chat'),
+        }
     return {
         'model': os.environ.get('TEST_MODEL', 'gpt-3.5-turbo'),
         'api_key': os.environ.get('TEST_API_KEY', ''),
@@ -27,9 +58,8 @@ def get_test_config():
 
 
 @unittest.skipUnless(AI_CLIENT_AVAILABLE, "ai_client module is not available")
-@unittest.skipUnless(get_test_config()['api_key'], "TEST_API_KEY environment variable not set")
 class TestAIClientIntegration(unittest.TestCase):
-    """Integration tests that require actual API access"""
+    """End-to-end tests against the configured API (or the fake server)"""
 
     def setUp(self):
         """Set up test client"""
@@ -49,12 +79,7 @@ class TestAIClientIntegration(unittest.TestCase):
         Action items: Update documentation, schedule follow-up meeting.
         """
 
-        prompt = ("Based on the following text, suggest a short, descriptive filename. "
-                 "Include an appropriate file extension (.txt, .md, .json, .py, etc.) "
-                 "based on the content type. Respond with ONLY the filename, nothing else.\n\n"
-                 "Text: {content}")
-
-        result = self.client.generate_filename(content, prompt)
+        result = self.client.generate_filename(content, PROMPT)
 
         self.assertIsNotNone(result)
         self.assertGreater(len(result), 0)
@@ -71,12 +96,7 @@ class TestAIClientIntegration(unittest.TestCase):
             return calculate_fibonacci(n-1) + calculate_fibonacci(n-2)
         """
 
-        prompt = ("Based on the following text, suggest a short, descriptive filename. "
-                 "Include an appropriate file extension (.txt, .md, .json, .py, etc.) "
-                 "based on the content type. Respond with ONLY the filename, nothing else.\n\n"
-                 "Text: {content}")
-
-        result = self.client.generate_filename(content, prompt)
+        result = self.client.generate_filename(content, PROMPT)
 
         self.assertIsNotNone(result)
         self.assertGreater(len(result), 0)
@@ -95,12 +115,7 @@ class TestAIClientIntegration(unittest.TestCase):
         }
         """
 
-        prompt = ("Based on the following text, suggest a short, descriptive filename. "
-                 "Include an appropriate file extension (.txt, .md, .json, .py, etc.) "
-                 "based on the content type. Respond with ONLY the filename, nothing else.\n\n"
-                 "Text: {content}")
-
-        result = self.client.generate_filename(content, prompt)
+        result = self.client.generate_filename(content, PROMPT)
 
         self.assertIsNotNone(result)
         self.assertGreater(len(result), 0)
@@ -122,12 +137,7 @@ class TestAIClientIntegration(unittest.TestCase):
         - Well documented
         """
 
-        prompt = ("Based on the following text, suggest a short, descriptive filename. "
-                 "Include an appropriate file extension (.txt, .md, .json, .py, etc.) "
-                 "based on the content type. Respond with ONLY the filename, nothing else.\n\n"
-                 "Text: {content}")
-
-        result = self.client.generate_filename(content, prompt)
+        result = self.client.generate_filename(content, PROMPT)
 
         self.assertIsNotNone(result)
         self.assertGreater(len(result), 0)
@@ -143,18 +153,100 @@ class TestAIClientIntegration(unittest.TestCase):
         # Truncate to first 250 words
         excerpt = extract_first_words(content, 250)
 
-        prompt = ("Based on the following text, suggest a short, descriptive filename. "
-                 "Include an appropriate file extension (.txt, .md, .json, .py, etc.) "
-                 "based on the content type. Respond with ONLY the filename, nothing else.\n\n"
-                 "Text: {content}")
-
-        result = self.client.generate_filename(excerpt, prompt)
+        result = self.client.generate_filename(excerpt, PROMPT)
 
         self.assertIsNotNone(result)
         self.assertGreater(len(result), 0)
         print("Generated filename for long content: {}".format(result))
 
 
+@unittest.skipUnless(AI_CLIENT_AVAILABLE, "ai_client module is not available")
+class TestFakeServer(unittest.TestCase):
+    """Hermetic end-to-end runs: both APIs, streaming and injected faults"""
+
+    def client(self, server, **kwargs):
+        kwargs.setdefault('retry_policy', ai_client.RetryPolicy(max_attempts=3, backoff_base=0.01))
+        return AIClient(model="fake-model", api_key="fake-key", api_base=server.base_url, **kwargs)
+
+    def test_filenames_are_deterministic(self):
+        """Same text, same name, on both APIs, streamed or not"""
+        content = "# Release Notes\n\nVersion 2 adds streaming."
+        expected = fake_filename(PROMPT.replace('{content}', content))
+        self.assertEqual(expected, "release-notes-version.md")
+        with FakeOpenAIServer() as server:
+            for api_type in ("chat", "responses"):
+                for stream in (False, True):
+                    result = self.client(server, api_type=api_type, stream=stream).generate_filename(content, PROMPT)
+                    self.assertEqual(result, expected, (api_type, stream))
+            paths = set(request['path'] for request in server.requests)
+        self.assertEqual(paths, {"/v1/chat/completions", "/v1/responses"})
+
+    def test_streaming_stops_before_chatter(self):
+        """A chatty model's explanation after the filename isn't waited for"""
+        chatter = "\n\nThis name reflects the heading of the text." * 10
+        with FakeOpenAIServer(chatter=chatter, stream_interval=0.05) as server:
+            start = time.time()
+            result = self.client(server, stream=True).generate_filename("Weekly status report", PROMPT)
+            self.assertEqual(result, "weekly-status-report.txt")
+            # Streaming the whole explanation would take over 5s
+            self.assertLess(time.time() - start, 3.0)
+
+    def test_repeated_instructions_report_cached_tokens(self):
+        """The static instructions prefix is reused across different texts"""
+        with FakeOpenAIServer() as server:
+            ai_client.metrics.reset()
+            client = self.client(server, prompt_cache="prompt_cache_key")
+            client.generate_filename("Sprint planning for the search team", PROMPT)
+            self.assertEqual(ai_client.metrics.snapshot()["counters"].get("usage.cached_tokens"), 0)
+            client.generate_filename("Postmortem for the login outage", PROMPT)
+            counters = ai_client.metrics.snapshot()["counters"]
+            self.assertGreater(counters["usage.cached_tokens"], 0)
+            # Only the second request's instructions were cached, never more than it sent
+            self.assertLess(counters["usage.cached_tokens"], counters["usage.input_tokens"] / 2)
+
+    def test_recovers_from_injected_faults(self):
+        """429, 500 and connection resets are retried until a reply gets through"""
+        for fault in ("429", "500", "reset"):
+            with FakeOpenAIServer(fault_sequence=[fault, fault]) as server:
+                result = self.client(server).generate_filename("Quarterly budget review", PROMPT)
+                self.assertEqual(result, "quarterly-budget-review.txt", fault)
+                self.assertEqual(server.outcomes(), {fault: 2, "ok": 1})
+
+    def test_slowloris_reply_hits_time_budget(self):
+        """A body trickling in byte by byte is abandoned at the deadline"""
+        with FakeOpenAIServer(fault_sequence=["slowloris"], slowloris_interval=0.1) as server:
+            start = time.time()
+            result = self.client(server).generate_filename("Slow reply", PROMPT, time_budget=0.5)
+            self.assertIsNone(result)
+            # Trickling the whole body would take well over 10s
+            self.assertLess(time.time() - start, 5.0)
+
+    def test_fault_rates_are_reproducible_with_seed(self):
+        """The same seed injects the same faults in the same order"""
+        runs = []
+        for _ in range(2):
+            with FakeOpenAIServer(faults={"500": 0.3}, seed=7) as server:
+                for i in range(20):
+                    self.client(server, retry_policy=ai_client.RetryPolicy(max_attempts=1)).generate_filename(
+                        "Note {}".format(i), PROMPT
+                    )
+                runs.append([request['outcome'] for request in server.requests])
+        self.assertEqual(runs[0], runs[1])
+        self.assertIn("500", runs[0])
+        self.assertIn("ok", runs[0])
+
+    def test_subprocess_server(self):
+        """The server runs out of process too, e.g. for benchmarks"""
+        process, base_url = start_subprocess("--latency", "fixed:0.01")
+        try:
+            client = AIClient(model="fake-model", api_key="fake-key", api_base=base_url)
+            self.assertEqual(client.generate_filename("import os\nprint(1)", PROMPT), "import-os-print.py")
+        finally:
+            process.terminate()
+            process.wait()
+            process.stdout.close()
+
+
 @unittest.skipUnless(AI_CLIENT_AVAILABLE, "ai_client module is not available")
 class TestAPIUnavailable(unittest.TestCase):
     """Test behavior when API service is not available"""